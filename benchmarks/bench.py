@@ -0,0 +1,324 @@
+"""Time the CFG and data flow tools on synthetic Bril programs.
+
+Programs are generated in a few shapes that stress different parts of
+the pipeline, at a configurable size, and each stage is timed on each of
+them. Results are written as JSON; pass an earlier results file with
+`--compare` to flag stages that got slower.
+
+    python3 bench.py --size 2000 --output results.json
+    python3 bench.py --size 2000 --compare results.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "dataflow_analysis_using_worklist"))
+sys.path.insert(0, str(ROOT / "working_with_cfgs"))
+
+import briltxt  # noqa: E402
+import cfg  # noqa: E402
+import colfunc  # noqa: E402
+import df  # noqa: E402
+import mycfg  # noqa: E402
+import ssa  # noqa: E402
+from form_blocks import form_blocks  # noqa: E402
+
+# Program generators. Each takes a size and returns a Bril function.
+
+
+def const(dest, value):
+    return {"op": "const", "dest": dest, "type": "int", "value": value}
+
+
+def binop(op, dest, a, b, type="int"):
+    return {"op": op, "dest": dest, "type": type, "args": [a, b]}
+
+
+def straight(size):
+    """Long straight-line code, cut into labeled blocks that fall
+    through to each other.
+    """
+    instrs = [const("x0", 1)]
+    for i in range(1, size):
+        if i % 8 == 0:
+            instrs.append({"label": "s{}".format(i)})
+        instrs.append(binop("add", "x{}".format(i), "x{}".format(i - 1), "x0"))
+    instrs.append({"op": "print", "args": ["x{}".format(size - 1)]})
+    return {"name": "straight", "instrs": instrs}
+
+
+def loops(size):
+    """Counted loops nested `size // 8` deep (at most 64), with a little
+    arithmetic in each.
+    """
+    depth = max(1, min(64, size // 8))
+    instrs = [const("one", 1), const("n", 3), const("acc", 0)]
+    for d in range(depth):
+        instrs += [
+            const("i{}".format(d), 0),
+            {"label": "head{}".format(d)},
+            binop("lt", "c{}".format(d), "i{}".format(d), "n", "bool"),
+            {
+                "op": "br",
+                "args": ["c{}".format(d)],
+                "labels": ["body{}".format(d), "exit{}".format(d)],
+            },
+            {"label": "body{}".format(d)},
+            binop("add", "acc", "acc", "i{}".format(d)),
+        ]
+    for d in reversed(range(depth)):
+        instrs += [
+            binop("add", "i{}".format(d), "i{}".format(d), "one"),
+            {"op": "jmp", "labels": ["head{}".format(d)]},
+            {"label": "exit{}".format(d)},
+        ]
+    instrs.append({"op": "print", "args": ["acc"]})
+    return {"name": "loops", "instrs": instrs}
+
+
+def irreducible(size):
+    """Chains of two-entry loops: each pair of blocks jumps to the other,
+    and both can be entered from outside.
+    """
+    instrs = [const("one", 1), const("x", 0), binop("lt", "c", "x", "one", "bool")]
+    for k in range(max(1, size // 8)):
+        a, b, out = "left{}".format(k), "right{}".format(k), "out{}".format(k)
+        instrs += [
+            {"op": "br", "args": ["c"], "labels": [a, b]},
+            {"label": a},
+            binop("add", "x", "x", "one"),
+            binop("lt", "c", "x", "one", "bool"),
+            {"op": "br", "args": ["c"], "labels": [b, out]},
+            {"label": b},
+            binop("sub", "x", "x", "one"),
+            binop("lt", "c", "x", "one", "bool"),
+            {"op": "br", "args": ["c"], "labels": [a, out]},
+            {"label": out},
+        ]
+    instrs.append({"op": "print", "args": ["x"]})
+    return {"name": "irreducible", "instrs": instrs}
+
+
+def switch(size):
+    """A wide switch: a chain of comparisons branching to `size // 4`
+    cases that all meet at one join block.
+    """
+    cases = max(1, size // 4)
+    instrs = [const("sel", 0), const("r", 0)]
+    for k in range(cases):
+        instrs += [
+            const("k{}".format(k), k),
+            binop("eq", "t{}".format(k), "sel", "k{}".format(k), "bool"),
+            {
+                "op": "br",
+                "args": ["t{}".format(k)],
+                "labels": ["case{}".format(k), "next{}".format(k)],
+            },
+            {"label": "case{}".format(k)},
+            binop("add", "r", "r", "k{}".format(k)),
+            {"op": "jmp", "labels": ["join"]},
+            {"label": "next{}".format(k)},
+        ]
+    instrs += [{"label": "join"}, {"op": "print", "args": ["r"]}]
+    return {"name": "switch", "instrs": instrs}
+
+
+def many_vars(size):
+    """Lots of distinct variables, all live across a loop."""
+    instrs = [const("one", 1), const("n", 3), const("i", 0)]
+    instrs += [const("v{}".format(k), k) for k in range(size)]
+    instrs += [
+        {"label": "head"},
+        binop("lt", "c", "i", "n", "bool"),
+        {"op": "br", "args": ["c"], "labels": ["body", "done"]},
+        {"label": "body"},
+    ]
+    instrs += [
+        binop("add", "v{}".format(k), "v{}".format(k), "v{}".format(k - 1))
+        for k in range(1, size)
+    ]
+    instrs += [
+        binop("add", "i", "i", "one"),
+        {"op": "jmp", "labels": ["head"]},
+        {"label": "done"},
+        {"op": "print", "args": ["v{}".format(size - 1)]},
+    ]
+    return {"name": "many_vars", "instrs": instrs}
+
+
+SHAPES = {
+    "straight": straight,
+    "loops": loops,
+    "irreducible": irreducible,
+    "switch": switch,
+    "many_vars": many_vars,
+}
+
+
+# Timing.
+
+
+def best_of(repeat, fn, setup=None):
+    """The fastest of `repeat` runs of `fn`, in seconds. `setup` runs
+    untimed before each one, and its result is passed to `fn`. Like
+    `timeit`, the garbage collector is off while timing.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+
+def fresh_blocks(func):
+    blocks = cfg.block_map(form_blocks(json.loads(json.dumps(func["instrs"]))))
+    cfg.add_terminators(blocks)
+    return blocks
+
+
+def bench_func(func, repeat):
+    """Time every stage on one function."""
+    instrs = func["instrs"]
+    results = {}
+
+    results["form_blocks"] = best_of(repeat, lambda: list(form_blocks(instrs)))
+    results["block_map"] = best_of(
+        repeat, cfg.block_map, lambda: list(form_blocks(instrs))
+    )
+    results["add_terminators"] = best_of(
+        repeat,
+        cfg.add_terminators,
+        lambda: cfg.block_map(form_blocks(json.loads(json.dumps(instrs)))),
+    )
+    results["build_cfg"] = best_of(
+        repeat,
+        cfg.build_cfg,
+        lambda: json.loads(json.dumps(instrs)),
+    )
+    blocks = fresh_blocks(func)
+    results["edges"] = best_of(repeat, lambda: cfg.edges(blocks))
+
+    for name, analysis in df.REACH_DEFINITIONS.items():
+
+        def run(analysis=analysis):
+            prepared, summaries, _ = df.prepare(blocks, analysis)
+            df.df_worklist(blocks, prepared, summaries)
+
+        results["df_worklist[{}]".format(name)] = best_of(repeat, run)
+
+    results["columnar"] = best_of(repeat, lambda: colfunc.ColumnarFunc(instrs))
+    for name, analysis in df.REACH_DEFINITIONS.items():
+        if not df.uses_bits(analysis):
+            continue
+
+        def run(layout, analysis=analysis):
+            masks, universe = colfunc.summarize(layout, analysis.genkill)
+            prepared, _, _ = df.bit_lower(analysis, {}, universe)
+            df.df_worklist(None, prepared, masks, graph=layout.graph())
+
+        results["df_columnar[{}]".format(name)] = best_of(
+            repeat, run, lambda: colfunc.ColumnarFunc(instrs)
+        )
+
+    results["to_ssa"] = best_of(
+        repeat, ssa.func_to_ssa, lambda: json.loads(json.dumps(func))
+    )
+
+    the_cfg = mycfg.get_cfg(mycfg.map_blocks(list(mycfg.form_blocks(instrs))))
+    entry = next(iter(the_cfg))
+    results["find_dominators"] = best_of(
+        repeat, lambda: mycfg.find_dominators(the_cfg, entry)
+    )
+    results["is_reduceable"] = best_of(
+        repeat, lambda: mycfg.is_reduceable(the_cfg, entry)
+    )
+
+    text = io.StringIO()
+    with contextlib.redirect_stdout(text):
+        briltxt.print_prog({"functions": [func]})
+    results["parse_bril"] = best_of(repeat, lambda: briltxt.parse_bril(text.getvalue()))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the stages that are more than `threshold` times slower than
+    in `baseline`. Returns how many there were.
+    """
+    slower = 0
+    for shape, stages in results["shapes"].items():
+        for stage, seconds in stages.items():
+            old = baseline["shapes"].get(shape, {}).get(stage)
+            if old and seconds > old * threshold:
+                slower += 1
+                print(
+                    "{} {}: {:.6f}s -> {:.6f}s ({:.2f}x)".format(
+                        shape, stage, old, seconds, seconds / old
+                    )
+                )
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bril tools")
+    parser.add_argument("-n", "--size", type=int, default=1000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument(
+        "-s",
+        "--shape",
+        action="append",
+        choices=sorted(SHAPES),
+        help="Only run these shapes (default: all).",
+    )
+    parser.add_argument("-o", "--output", help="Write results as JSON here.")
+    parser.add_argument("-c", "--compare", help="Earlier results to compare to.")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio that counts as a regression.",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "size": args.size,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "shapes": {},
+    }
+    for shape in args.shape or sorted(SHAPES):
+        func = SHAPES[shape](args.size)
+        stages = bench_func(func, args.repeat)
+        results["shapes"][shape] = stages
+        for stage, seconds in stages.items():
+            print("{:12} {:26} {:.6f}s".format(shape, stage, seconds))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
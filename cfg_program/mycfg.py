@@ -1,7 +1,10 @@
-import json
+import io
 import sys
 import argparse
 
+import briltxt
+from brilpack import load_bril
+
 
 def form_blocks(instructions, debug=False) -> list:
     if debug:
@@ -142,11 +145,52 @@ def get_cfg(block_map, debug=False) -> dict:
     return the_cfg
 
 
-def gen_dot(cfg, debug=False) -> str:
-    dot_script = "digraph {\n"
+def dot_label(name, block) -> str:
+    """
+    desc: build a left justified DOT label listing a block's instructions
+
+    param: name(str)    = block name
+    param: block(list)  = instructions in the block
+
+    returns: escaped label text
+    """
+    lines = [f"{name}:"]
+    lines += [f"  {briltxt.instr_to_string(inst)}" for inst in block if "op" in inst]
+    return "".join(
+        line.replace("\\", "\\\\").replace('"', '\\"') + "\\l" for line in lines
+    )
+
+
+def write_dot(cfg, out, block_map=None, cluster=None, debug=False) -> None:
+    """
+    desc: write the DOT script for a CFG straight to a file-like object,
+          one line per node and edge
+
+    param: cfg(dict)       = mapping{node: [successors]}
+    param: out(file)       = where to write the script
+    param: block_map(dict) = mapping{node: block}, to label nodes with
+                             their instructions
+    param: cluster(str)    = function name, to write a `subgraph cluster`
+                             for that function instead of a digraph
+    """
+    if cluster is None:
+        prefix = ""
+        out.write("digraph {\n")
+    else:
+        # node names need to be unique across the whole program
+        prefix = f"{cluster}."
+        out.write(f'subgraph "cluster_{cluster}" {{\n')
+        out.write(f'     label="@{cluster}";\n')
+
     # define nodes based on cfg
     for name in cfg.keys():
-        dot_script += f'     "{name}";\n'
+        if block_map is not None:
+            label = dot_label(name, block_map[name])
+            out.write(f'     "{prefix}{name}" [shape=box, label="{label}"];\n')
+        elif cluster is not None:
+            out.write(f'     "{prefix}{name}" [label="{name}"];\n')
+        else:
+            out.write(f'     "{name}";\n')
 
     # define edges based on cfg
     for name, successors in cfg.items():
@@ -157,16 +201,93 @@ def gen_dot(cfg, debug=False) -> str:
         for successor in successors:
             if debug:
                 print(f"\nSuccessor in successors:\n{successor}\n")
-            dot_script += f'     "{name}" -> "{successor}";\n'
+            out.write(f'     "{prefix}{name}" -> "{prefix}{successor}";\n')
+
+    out.write("}\n")
+
+
+def write_program_dot(cfgs, out, block_maps=None, calls=None, debug=False) -> None:
+    """
+    desc: write one digraph with a `subgraph cluster` per function
+
+    param: cfgs(dict)       = mapping{function name: cfg}
+    param: out(file)        = where to write the script
+    param: block_maps(dict) = mapping{function name: block map}, to label
+                              nodes with their instructions
+    param: calls(list)      = call sites (caller, block, callee), drawn as
+                              dashed edges to the callee's entry block
+    """
+    out.write("digraph {\n")
+    for func_name, cfg in cfgs.items():
+        block_map = block_maps[func_name] if block_maps is not None else None
+        write_dot(cfg, out, block_map, cluster=func_name, debug=debug)
+    for caller, block, callee in calls or []:
+        # calls to functions outside the program have nowhere to go
+        if cfgs.get(callee):
+            entry = next(iter(cfgs[callee]))
+            out.write(
+                f'     "{caller}.{block}" -> "{callee}.{entry}" [style=dashed];\n'
+            )
+    out.write("}\n")
+
+
+def gen_dot(cfg, debug=False) -> str:
+    dot_script = io.StringIO()
+    write_dot(cfg, dot_script, debug=debug)
+    return dot_script.getvalue()
 
-    dot_script += "}\n"
-    return dot_script
 
+# whole program
 
-def mycfg(debug_mode: bool, file_path: str = None) -> None:
-    # load JSON from stdin
-    prog = json.load(sys.stdin)
+
+def find_call_sites(block_map) -> list[tuple[str, str]]:
+    """
+    desc: find the calls made in a function from the `funcs` field
+          of its `call` instructions
+
+    param: block_map(dict) = mapping{node: block}
+
+    returns: list of (block, callee) in program order
+    """
+    call_sites = []
+    for name, block in block_map.items():
+        for inst in block:
+            if inst.get("op") == "call":
+                call_sites.extend((name, callee) for callee in inst.get("funcs", []))
+    return call_sites
+
+
+def whole_program(funcs, debug_mode, labels) -> None:
+    block_maps = {}
+    cfgs = {}
+    for func in funcs:
+        blocks = form_blocks(func.get("instrs", []), debug_mode)
+        block_maps[func["name"]] = map_blocks(blocks or [], debug_mode)
+        cfgs[func["name"]] = get_cfg(block_maps[func["name"]], debug_mode)
+
+    calls = [
+        (name, block, callee)
+        for name, block_map in block_maps.items()
+        for block, callee in find_call_sites(block_map)
+    ]
+    write_program_dot(
+        cfgs, sys.stdout, block_maps if labels else None, calls, debug_mode
+    )
+    print()
+
+
+def mycfg(
+    debug_mode: bool,
+    file_path: str = None,
+    labels: bool = False,
+    all_funcs: bool = False,
+) -> None:
+    # load JSON or a packed program from the file, or stdin
+    prog = load_bril(file_path)
     funcs = prog["functions"]
+    if all_funcs:
+        whole_program(funcs, debug_mode, labels)
+        return
     # loading the just the first function, for now
     func_instrs = funcs[0]["instrs"]
 
@@ -179,11 +300,18 @@ def mycfg(debug_mode: bool, file_path: str = None) -> None:
     # create cfg
     new_cfg = get_cfg(name_to_block, debug_mode)
 
-    dot_string = gen_dot(new_cfg, debug_mode)
-    print(dot_string)
+    block_map = name_to_block if labels else None
+    if not debug_mode:
+        write_dot(new_cfg, sys.stdout, block_map)
+        print()
+        return
 
-    if debug_mode:
-        print(f"\nThe digraph:\n{dot_string}")
+    # the trace comes out while the script is written, so keep the
+    # script to print it again after the trace
+    dot_script = io.StringIO()
+    write_dot(new_cfg, dot_script, block_map, debug=debug_mode)
+    print(dot_script.getvalue())
+    print(f"\nThe digraph:\n{dot_script.getvalue()}")
     return
 
 
@@ -200,5 +328,17 @@ if __name__ == "__main__":
         nargs="?",
         help="Input file to proccess. If not provided, reads from stdin",
     )
+    parser.add_argument(
+        "-l",
+        "--labels",
+        action="store_true",
+        help="Label each node with the instructions in its block.",
+    )
+    parser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        help="Build a CFG for every function, plus the call graph.",
+    )
     args = parser.parse_args()
-    mycfg(args.debug, args.file)
+    mycfg(args.debug, args.file, args.labels, args.all)
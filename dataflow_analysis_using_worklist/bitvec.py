@@ -0,0 +1,64 @@
+"""Bit-vector lattice values for gen/kill data flow analyses.
+
+Every element an analysis talks about (a variable, a definition, an
+expression) is given a dense index in a `Universe`, and a set of
+elements is stored as a Python int with one bit per index. The
+transfer and merge functions are then plain integer operations.
+"""
+
+
+class Universe:
+    """A dense numbering of the elements of a data flow domain."""
+
+    def __init__(self):
+        self.elements = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.elements)
+
+    def add(self, elem):
+        """Get the index of `elem`, numbering it if it is new."""
+        i = self.index.get(elem)
+        if i is None:
+            i = len(self.elements)
+            self.index[elem] = i
+            self.elements.append(elem)
+        return i
+
+    def encode(self, elems):
+        """Turn an iterable of elements into a bit vector."""
+        bits = 0
+        for elem in elems:
+            bits |= 1 << self.add(elem)
+        return bits
+
+    def decode(self, bits):
+        """Turn a bit vector back into a set of elements."""
+        out = set()
+        while bits:
+            low = bits & -bits
+            out.add(self.elements[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+
+def union(vals):
+    out = 0
+    for v in vals:
+        out |= v
+    return out
+
+
+def intersection(vals):
+    vals = iter(vals)
+    out = next(vals, 0)
+    for v in vals:
+        out &= v
+    return out
+
+
+def transfer(local, val):
+    """The gen/kill transfer function, given a block's (gen, kill) masks."""
+    gen, kill = local
+    return gen | (val & ~kill)
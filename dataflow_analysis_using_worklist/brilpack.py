@@ -0,0 +1,448 @@
+"""A packed binary format for Bril programs.
+
+Loading a big program as JSON spends most of its time parsing and
+allocating a dict per instruction. A packed file instead stores every
+string once, in a string table, and each function's instructions as
+columns of 32-bit integers (opcode, dest, type, ... as string IDs, and
+offsets into flat arrays of argument, label and callee IDs). The file
+is memory-mapped, so opening it only reads the header and the function
+directory; a function's columns are decoded into the usual JSON dicts
+the first time it is looked at.
+
+Layout, with a little-endian header and everything else in the byte
+order of the machine that wrote it:
+
+    header       MAGIC, byte order, counts and section offsets
+    strings      (count + 1) int64 offsets, then the UTF-8 blob
+    directory    per function: int64 offset of its columns, and int32
+                 IDs of its name and its JSON-encoded args, type and
+                 any other keys
+    functions    per function: int32 counts, then the columns
+
+Types, constant values and any keys this format has no column for are
+stored as JSON text in the string table, so packing is lossless.
+
+    python3 brilpack.py < prog.json > prog.bpk
+    python3 brilpack.py -u < prog.bpk > prog.json
+
+`working_with_cfgs` and `cfg_program` use this file through symlinks
+to it, so each directory still runs on its own with one copy to edit.
+"""
+
+import gc
+import json
+import mmap
+import struct
+import sys
+import argparse
+from array import array
+from collections.abc import Mapping, Sequence
+
+MAGIC = b"BRILPAK1"
+_HEADER = struct.Struct("<8s8sqqqqqi4x")
+_ALIGN = 8
+
+# Bits of the flags column: which list-valued fields an instruction has.
+_ARGS, _LABELS, _FUNCS = 1, 2, 4
+_LISTS = (("args", _ARGS), ("labels", _LABELS), ("funcs", _FUNCS))
+# Keys with a column of their own.
+_COLUMNS = {"op", "label", "dest", "type", "value", "args", "labels", "funcs"}
+_FUNC_KEYS = {"name", "args", "type", "instrs"}
+
+
+def _pad(n):
+    return -n % _ALIGN
+
+
+class _Writer:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def intern_json(self, value):
+        return self.intern(json.dumps(value, sort_keys=True))
+
+    def extra(self, obj, known):
+        rest = {k: v for k, v in obj.items() if k not in known}
+        return self.intern_json(rest) if rest else -1
+
+    def function(self, func):
+        """Pack one function's instructions into its column section."""
+        instrs = func.get("instrs", [])
+        cols = {name: array("i") for name in ("op", "dest", "type", "value")}
+        extra, flags = array("i"), array("i")
+        lists = {key: (array("i", [0]), array("i")) for key, _ in _LISTS}
+        for instr in instrs:
+            if "label" in instr:
+                cols["op"].append(-1)
+                cols["dest"].append(self.intern(instr["label"]))
+            else:
+                cols["op"].append(self.intern(instr["op"]))
+                cols["dest"].append(
+                    self.intern(instr["dest"]) if "dest" in instr else -1
+                )
+            cols["type"].append(
+                self.intern_json(instr["type"]) if "type" in instr else -1
+            )
+            cols["value"].append(
+                self.intern_json(instr["value"]) if "value" in instr else -1
+            )
+            extra.append(self.extra(instr, _COLUMNS))
+            bits = 0
+            for key, bit in _LISTS:
+                offsets, flat = lists[key]
+                if key in instr:
+                    bits |= bit
+                    flat.extend(self.intern(s) for s in instr[key])
+                offsets.append(len(flat))
+            flags.append(bits)
+
+        counts = array("i", [len(instrs)] + [len(lists[key][1]) for key, _ in _LISTS])
+        counts.append(0)  # Padding, to keep the columns 8-byte aligned.
+        parts = [counts, cols["op"], cols["dest"], cols["type"], cols["value"]]
+        parts += [extra, flags]
+        for key, _ in _LISTS:
+            parts += lists[key]
+        out = bytearray()
+        for part in parts:
+            out += part.tobytes()
+            out += bytes(_pad(len(out)))
+        return bytes(out)
+
+
+def dump(bril, f):
+    """Write a Bril program (as JSON data) to the binary file `f`."""
+    writer = _Writer()
+    prog_extra = writer.extra(bril, {"functions"})
+    sections = []
+    directory = array("i")
+    for func in bril.get("functions", []):
+        sections.append(writer.function(func))
+        directory.extend(
+            [
+                writer.intern(func["name"]),
+                writer.intern_json(func["args"]) if "args" in func else -1,
+                writer.intern_json(func["type"]) if "type" in func else -1,
+                writer.extra(func, _FUNC_KEYS),
+            ]
+        )
+
+    blob = bytearray()
+    string_offsets = array("q", [0])
+    for s in writer.strings:
+        blob += s.encode("utf-8")
+        string_offsets.append(len(blob))
+
+    pos = _HEADER.size
+    strings_pos = pos
+    pos += len(string_offsets) * 8
+    blob_pos = pos
+    pos += len(blob) + _pad(len(blob))
+    directory_pos = pos
+    func_offsets = array("q")
+    pos += len(sections) * 8 + len(directory) * 4
+    pos += _pad(pos)
+    for section in sections:
+        func_offsets.append(pos)
+        pos += len(section)
+
+    f.write(
+        _HEADER.pack(
+            MAGIC,
+            sys.byteorder.encode().ljust(8, b"\0"),
+            len(writer.strings),
+            len(sections),
+            strings_pos,
+            blob_pos,
+            directory_pos,
+            prog_extra,
+        )
+    )
+    f.write(string_offsets.tobytes())
+    f.write(blob + bytes(_pad(len(blob))))
+    head = func_offsets.tobytes() + directory.tobytes()
+    f.write(head + bytes(_pad(len(head))))
+    for section in sections:
+        f.write(section)
+
+
+class PackedProgram:
+    """A packed program, opened over a buffer (usually an `mmap`).
+
+    Strings are decoded, and functions unpacked, only when first needed,
+    and then kept.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        view = memoryview(buf)
+        magic, order, nstrings, nfuncs, strings_pos, blob_pos, directory_pos, extra = (
+            _HEADER.unpack_from(buf, 0)
+        )
+        if magic != MAGIC:
+            raise ValueError("not a packed bril file")
+        self.swap = order.rstrip(b"\0").decode() != sys.byteorder
+        self.view = view
+        self.string_offsets = self._ints("q", strings_pos, nstrings + 1)
+        self.blob_pos = blob_pos
+        self.strings = [None] * nstrings
+        self.json_cache = {}
+        self.func_offsets = self._ints("q", directory_pos, nfuncs)
+        self.directory = self._ints("i", directory_pos + nfuncs * 8, nfuncs * 4)
+        self.extra = extra
+        self.funcs = [None] * nfuncs
+        self.names = None
+
+    def _ints(self, typecode, pos, count):
+        """An integer column of the file, without copying it if the byte
+        order already matches.
+        """
+        size = array(typecode).itemsize
+        chunk = self.view[pos : pos + count * size]
+        if not self.swap:
+            return chunk.cast(typecode)
+        swapped = array(typecode, chunk.tobytes())
+        swapped.byteswap()
+        return swapped
+
+    def string(self, i):
+        s = self.strings[i]
+        if s is None:
+            start = self.blob_pos + self.string_offsets[i]
+            end = self.blob_pos + self.string_offsets[i + 1]
+            s = self.strings[i] = str(self.view[start:end], "utf-8")
+        return s
+
+    def json(self, i):
+        """JSON value `i`, decoded once and shared: don't modify it."""
+        if i not in self.json_cache:
+            self.json_cache[i] = json.loads(self.string(i))
+        return self.json_cache[i]
+
+    def value(self, i):
+        """JSON value `i` for a caller to keep. Dicts and lists are
+        decoded afresh every time, so editing one never shows up in
+        another instruction or function.
+        """
+        val = self.json(i)
+        if isinstance(val, (dict, list)):
+            return json.loads(self.string(i))
+        return val
+
+    def __len__(self):
+        return len(self.funcs)
+
+    def function(self, index):
+        """Unpack function `index` into a JSON-style dict."""
+        if self.funcs[index] is None:
+            # Unpacking only allocates, which needlessly triggers the
+            # cycle collector over and over.
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                self.funcs[index] = self._unpack(index)
+            finally:
+                if enabled:
+                    gc.enable()
+        return self.funcs[index]
+
+    def index(self, name):
+        """The position of the function called `name`."""
+        return self.function_names()[name]
+
+    def function_names(self):
+        """{name: position} of every function, in program order, read
+        from the directory without unpacking any function.
+        """
+        if self.names is None:
+            self.names = {
+                self.string(self.directory[i * 4]): i for i in range(len(self.funcs))
+            }
+        return self.names
+
+    def program(self):
+        """The whole program as JSON data, with functions loaded lazily."""
+        bril = self.value(self.extra) if self.extra != -1 else {}
+        bril["functions"] = LazyFunctions(self)
+        return bril
+
+    def _unpack(self, index):
+        name, args, type_, extra = self.directory[index * 4 : index * 4 + 4]
+        func = self.value(extra) if extra != -1 else {}
+        func["name"] = self.string(name)
+        if args != -1:
+            func["args"] = self.value(args)
+        if type_ != -1:
+            func["type"] = self.value(type_)
+
+        pos = self.func_offsets[index]
+        counts = self._ints("i", pos, 5)
+        n = counts[0]
+        pos += 5 * 4 + _pad(5 * 4)
+        cols = []
+        for _ in range(6):
+            cols.append(self._ints("i", pos, n))
+            pos += n * 4 + _pad(n * 4)
+        lists = []
+        for count in counts[1:4]:
+            offsets = self._ints("i", pos, n + 1)
+            pos += (n + 1) * 4 + _pad((n + 1) * 4)
+            flat = self._ints("i", pos, count)
+            pos += count * 4 + _pad(count * 4)
+            lists.append((offsets, flat))
+
+        # Decode every string and JSON value the function uses up front,
+        # so the loop below only indexes lists.
+        ops, dests, types, values, extras, flags = (col.tolist() for col in cols)
+        (args_at, args), (labels_at, labels), (funcs_at, funcs) = (
+            (offsets.tolist(), flat.tolist()) for offsets, flat in lists
+        )
+        strs = self.strings
+        for i in {*ops, *dests, *args, *labels, *funcs}:
+            if i != -1 and strs[i] is None:
+                self.string(i)
+        # Scalars are shared between instructions; the rest (pointer
+        # types, extra keys) are decoded for each instruction.
+        jsons = {i: self.json(i) for i in {*types, *values} if i != -1}
+        fresh = {i for i, val in jsons.items() if isinstance(val, (dict, list))}
+        value = self.value
+
+        instrs = []
+        for i in range(n):
+            extra = extras[i]
+            instr = value(extra) if extra != -1 else {}
+            if ops[i] == -1:
+                instr["label"] = strs[dests[i]]
+            else:
+                instr["op"] = strs[ops[i]]
+                if dests[i] != -1:
+                    instr["dest"] = strs[dests[i]]
+            type_ = types[i]
+            if type_ != -1:
+                instr["type"] = value(type_) if type_ in fresh else jsons[type_]
+            val = values[i]
+            if val != -1:
+                instr["value"] = value(val) if val in fresh else jsons[val]
+            bits = flags[i]
+            if bits & _ARGS:
+                instr["args"] = [strs[s] for s in args[args_at[i] : args_at[i + 1]]]
+            if bits & _LABELS:
+                instr["labels"] = [
+                    strs[s] for s in labels[labels_at[i] : labels_at[i + 1]]
+                ]
+            if bits & _FUNCS:
+                instr["funcs"] = [strs[s] for s in funcs[funcs_at[i] : funcs_at[i + 1]]]
+            instrs.append(instr)
+        func["instrs"] = instrs
+        return func
+
+
+class LazyFunctions(Sequence):
+    """The `functions` list of a packed program. Each function is
+    unpacked on first access.
+    """
+
+    def __init__(self, packed):
+        self.packed = packed
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.packed.function(index)
+
+    def by_name(self, name):
+        return self.packed.function(self.packed.index(name))
+
+
+class FunctionsByName(Mapping):
+    """The functions of a packed program by name, in program order. Each
+    function is unpacked on first access.
+    """
+
+    def __init__(self, packed):
+        self.packed = packed
+
+    def __getitem__(self, name):
+        return self.packed.function(self.packed.index(name))
+
+    def __iter__(self):
+        return iter(self.packed.function_names())
+
+    def __len__(self):
+        return len(self.packed.function_names())
+
+
+def functions_by_name(bril):
+    """The functions of a program as a mapping from name to function.
+    For a packed program, listing the names reads only the directory, and
+    a function is only unpacked when it is looked up.
+    """
+    funcs = bril.get("functions", [])
+    if isinstance(funcs, LazyFunctions):
+        return FunctionsByName(funcs.packed)
+    return {func["name"]: func for func in funcs}
+
+
+def loads(data):
+    """Open a packed program held in memory."""
+    return PackedProgram(data).program()
+
+
+def load(path):
+    """Open a packed program file by memory-mapping it."""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return PackedProgram(buf).program()
+
+
+def load_bril(path=None):
+    """Load a Bril program from the file at `path`, or from stdin if no
+    path is given. Packed files are recognized by their magic number,
+    and anything else is read as JSON.
+    """
+    if path is None:
+        data = sys.stdin.buffer.read()
+        if data.startswith(MAGIC):
+            return loads(data)
+        return json.loads(data)
+    with open(path, "rb") as f:
+        packed = f.read(len(MAGIC)) == MAGIC
+        if not packed:
+            f.seek(0)
+            return json.load(f)
+    return load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert bril JSON on stdin to the packed format, or back"
+    )
+    parser.add_argument(
+        "-u",
+        "--unpack",
+        action="store_true",
+        help="Read a packed program and print it as JSON.",
+    )
+    args = parser.parse_args()
+
+    if args.unpack:
+        bril = load_bril()
+        bril["functions"] = list(bril["functions"])
+        json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        dump(json.load(sys.stdin), sys.stdout.buffer)
@@ -10,6 +10,7 @@ format and emits the ordinary JSON representation.
 import lark
 import sys
 import json
+import functools
 
 __version__ = "0.0.1"
 
@@ -22,7 +23,7 @@ start: (struct | func)*
 struct: STRUCT IDENT "=" "{" mbr* "}"
 mbr: IDENT ":" type ";"
 
-func: FUNC ["(" arg_list? ")"] [tyann] "{" instr* "}"
+func: FUNC ["(" arg_list ")"] [tyann] "{" instr* "}"
 arg_list: | arg ("," arg)*
 arg: IDENT ":" type
 ?instr: const | vop | eop | label
@@ -230,17 +231,86 @@ class JSONTransformer(lark.Transformer):
         return value
 
 
-def parse_bril(txt, include_pos=False):
+class StreamTransformer(JSONTransformer):
+    """Write compact JSON to `self.out` one function at a time, as each
+    function is reduced, instead of building the whole program first.
+
+    Meant to be run inline by an LALR parser (see `get_stream_parser`).
+    """
+
+    def __init__(self, include_pos=False):
+        super().__init__(include_pos)
+        self.out = None
+        self.first = True
+
+    def reset(self, out):
+        self.out = out
+        self.first = True
+        out.write('{"functions":[')
+
+    def func(self, items):
+        func = super().func(items)
+        if not self.first:
+            self.out.write(",")
+        self.first = False
+        json.dump(func, self.out, separators=(",", ":"))
+
+    def start(self, items):
+        structs = [i for i in items if i is not None]
+        self.out.write("]")
+        if structs:
+            self.out.write(',"structs":')
+            json.dump(structs, self.out, separators=(",", ":"))
+        self.out.write("}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser():
+    """Build the text format parser once per process.
+
+    The grammar is LALR(1), so Lark can also keep the compiled parser in
+    its on-disk cache and skip grammar analysis on later runs.
+    """
+    return lark.Lark(GRAMMAR, parser="lalr", maybe_placeholders=True, cache=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_stream_parser(include_pos=False):
+    """Build a parser that runs a `StreamTransformer` as it parses."""
+    transformer = StreamTransformer(include_pos)
+    parser = lark.Lark(
+        GRAMMAR,
+        parser="lalr",
+        maybe_placeholders=True,
+        cache=True,
+        transformer=transformer,
+    )
+    return parser, transformer
+
+
+def parse_bril(txt, include_pos=False, compact=False):
     """Parse a Bril program and return a JSON string.
 
-    Optionally include source position information.
+    Optionally include source position information. A `compact` string
+    skips key sorting and indentation.
     """
-    parser = lark.Lark(GRAMMAR, maybe_placeholders=True)
-    tree = parser.parse(txt)
+    tree = get_parser().parse(txt)
     data = JSONTransformer(include_pos).transform(tree)
+    if compact:
+        return json.dumps(data, separators=(",", ":"))
     return json.dumps(data, indent=2, sort_keys=True)
 
 
+def stream_bril(txt, out, include_pos=False):
+    """Parse a Bril program and write it to the file `out` as compact
+    JSON, one function at a time, without holding the whole program's
+    tree or JSON string in memory.
+    """
+    parser, transformer = get_stream_parser(include_pos)
+    transformer.reset(out)
+    parser.parse(txt)
+
+
 # Text format pretty-printer.
 
 
@@ -335,7 +405,30 @@ def print_prog(prog):
 
 
 def bril2json():
-    print(parse_bril(sys.stdin.read(), "-p" in sys.argv[1:]))
+    """Convert text to JSON. With no file arguments, read stdin and print
+    to stdout; otherwise convert each `name.bril` to `name.json`, reusing
+    one parser for all of them. With `-c`, stream compact JSON.
+    """
+    include_pos = "-p" in sys.argv[1:]
+    compact = "-c" in sys.argv[1:]
+    paths = [a for a in sys.argv[1:] if not a.startswith("-")]
+
+    def convert(txt, out):
+        if compact:
+            stream_bril(txt, out, include_pos)
+        else:
+            out.write(parse_bril(txt, include_pos))
+        out.write("\n")
+
+    if not paths:
+        convert(sys.stdin.read(), sys.stdout)
+        return
+    for path in paths:
+        with open(path) as f:
+            txt = f.read()
+        out_path = (path[:-5] if path.endswith(".bril") else path) + ".json"
+        with open(out_path, "w") as f:
+            convert(txt, f)
 
 
 def bril2txt():
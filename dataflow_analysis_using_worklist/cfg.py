@@ -1,17 +1,25 @@
 from collections import OrderedDict
-from util import fresh, flatten
+from util import Names, flatten
 from form_blocks import TERMINATORS
 
 
-def block_map(blocks):
+def block_map(blocks, names=None):
     """Given a sequence of basic blocks, which are lists of instructions,
     produce a `OrderedDict` mapping names to blocks.
 
     The name of the block comes from the label it starts with, if any.
     Anonymous blocks, which don't start with a label, get an
-    automatically generated name. Blocks in the mapping have their
-    labels removed.
+    automatically generated name from `names` (a `util.Names`), which
+    never clashes with a label. Blocks in the mapping have their labels
+    removed.
     """
+    blocks = list(blocks)
+    if names is None:
+        names = Names()
+    for block in blocks:
+        if "label" in block[0]:
+            names.reserve(block[0]["label"])
+
     by_name = OrderedDict()
 
     for block in blocks:
@@ -23,7 +31,7 @@ def block_map(blocks):
             block = block[1:]
         else:
             # Make up a new name for this anonymous block.
-            name = fresh("b", by_name)
+            name = names.fresh("b")
 
         # Add the block to the mapping.
         by_name[name] = block
@@ -49,29 +57,24 @@ def add_terminators(blocks):
     """Given an ordered block map, modify the blocks to add terminators
     to all blocks (avoiding "fall-through" control flow transfers).
     """
+    names = list(blocks.keys())
     for i, block in enumerate(blocks.values()):
-        if not block:
+        if not block or block[-1]["op"] not in TERMINATORS:
             if i == len(blocks) - 1:
                 # In the last block, return.
                 block.append({"op": "ret", "args": []})
-            else:
-                dest = list(blocks.keys())[i + 1]
-                block.append({"op": "jmp", "labels": [dest]})
-        elif block[-1]["op"] not in TERMINATORS:
-            if i == len(blocks) - 1:
-                block.append({"op": "ret", "args": []})
             else:
                 # Otherwise, jump to the next block.
-                dest = list(blocks.keys())[i + 1]
-                block.append({"op": "jmp", "labels": [dest]})
+                block.append({"op": "jmp", "labels": [names[i + 1]]})
 
 
-def add_entry(blocks):
+def add_entry(blocks, names=None):
     """Ensure that a CFG has a unique entry block with no predecessors.
 
     If the first block already has no in-edges, do nothing. Otherwise,
     add a new block before it that has no in-edges but transfers control
-    to the old first block.
+    to the old first block. Its name comes from `names`, the `util.Names`
+    the blocks were named with, if given.
     """
     first_lbl = next(iter(blocks.keys()))
 
@@ -83,7 +86,9 @@ def add_entry(blocks):
         return
 
     # References exist; insert a new block.
-    new_lbl = fresh("entry", blocks)
+    if names is None:
+        names = Names(blocks)
+    new_lbl = names.fresh("entry")
     blocks[new_lbl] = []
     blocks.move_to_end(new_lbl, last=False)
 
@@ -102,6 +107,60 @@ def edges(blocks):
     return preds, succs
 
 
+def build_cfg(instrs, names=None):
+    """Form the CFG of a function's instructions in one pass.
+
+    This is `form_blocks`, `block_map`, `add_terminators` and `edges`
+    fused together: it returns the same block map (with terminators) and
+    the same (preds, succs) mappings, but only forms each instruction
+    into a block once. (The labels are collected first, so that `names`
+    can keep generated names clear of them.)
+    """
+    if names is None:
+        names = Names()
+    for instr in instrs:
+        if "label" in instr:
+            names.reserve(instr["label"])
+
+    blocks = OrderedDict()
+    succs = {}
+    incoming = {}
+
+    # The block being formed, or None after a terminator.
+    name = block = None
+    for instr in instrs:
+        if "op" in instr:
+            if block is None:
+                # An instruction after a terminator starts an anonymous
+                # block.
+                name = names.fresh("b")
+                block = blocks[name] = []
+                succs[name] = []
+            block.append(instr)
+            if instr["op"] in TERMINATORS:
+                for succ in successors(instr):
+                    succs[name].append(succ)
+                    incoming.setdefault(succ, []).append(name)
+                block = None
+        else:
+            if block is not None:
+                # Fall through to the new label.
+                block.append({"op": "jmp", "labels": [instr["label"]]})
+                succs[name].append(instr["label"])
+                incoming.setdefault(instr["label"], []).append(name)
+            name = instr["label"]
+            block = blocks[name] = []
+            succs[name] = []
+    if block is not None:
+        block.append({"op": "ret", "args": []})
+
+    preds = {name: incoming.pop(name, []) for name in blocks}
+    if incoming:
+        # Like `edges`, refuse jumps to labels that don't exist.
+        raise KeyError(next(iter(incoming)))
+    return blocks, preds, succs
+
+
 def reassemble(blocks):
     """Flatten a CFG into an instruction list."""
     # This could optimize slightly by opportunistically eliminating
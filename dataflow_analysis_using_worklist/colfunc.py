@@ -0,0 +1,264 @@
+"""A columnar layout for the instructions of one function.
+
+Instead of a dict per instruction, a `ColumnarFunc` keeps parallel
+`array("i")` columns: the opcode ID of every instruction (-1 for
+labels), the interned ID of its dest (-1 for none), and CSR-style
+offsets into one flat array of argument variable IDs. Blocks are ranges
+of instruction indices rather than copied lists. Anything else an
+instruction carries (types, values, labels, ...) is kept on the side,
+so the layout converts back to the dict form unchanged.
+
+Variables and expressions are interned in `bitvec.Universe`s, so the
+gen/kill helpers here build bit vectors directly, without going through
+sets of names. `df.py` uses them when run with `--columnar`.
+"""
+
+from array import array
+
+import bitvec
+from cfg import successors
+from compact_cfg import CompactCFG
+from form_blocks import TERMINATORS
+from util import Names
+
+# The expression of the `ret` that `cfg.build_cfg` adds.
+_RET = ("ret",)
+
+
+class ColumnarFunc:
+    """The instructions of one function, stored by column, and split into
+    basic blocks named the way `cfg.build_cfg` names them.
+    """
+
+    def __init__(self, instrs):
+        self._exprs = None
+        self.op = array("i")
+        self.dest = array("i")
+        self.arg_offsets = array("i", [0])
+        self.args = array("i")
+        # The other keys of each instruction, with "args" set to None if
+        # it had an (even empty) args list.
+        self.rest = []
+
+        # Block names, each block's [start, end) range of instructions
+        # (without its label), and its successors.
+        self.names = []
+        self.starts = array("i")
+        self.ends = array("i")
+        self.succs = []
+        # The block that runs off the end of the function, which
+        # `cfg.build_cfg` would end with a `ret`, or -1.
+        self.implicit_ret = -1
+
+        names = Names(instr["label"] for instr in instrs if "label" in instr)
+        op_ids, var_ids = {}, {}
+        ops, dests, flat, offsets = self.op, self.dest, self.args, self.arg_offsets
+        rests = self.rest
+        open_block = False
+        for i, instr in enumerate(instrs):
+            rest = instr.copy()
+            rests.append(rest)
+            if "label" in instr:
+                ops.append(-1)
+                dests.append(-1)
+                offsets.append(len(flat))
+                if open_block:
+                    # Fall through to the new label.
+                    self.ends.append(i)
+                    self.succs.append([instr["label"]])
+                self.names.append(instr["label"])
+                self.starts.append(i + 1)
+                open_block = True
+                continue
+
+            op = rest.pop("op")
+            ops.append(op_ids.setdefault(op, len(op_ids)))
+            dest = rest.pop("dest", None)
+            dests.append(-1 if dest is None else var_ids.setdefault(dest, len(var_ids)))
+            if "args" in rest:
+                flat.extend(
+                    [var_ids.setdefault(arg, len(var_ids)) for arg in rest["args"]]
+                )
+                rest["args"] = None
+            offsets.append(len(flat))
+
+            if not open_block:
+                # An instruction after a terminator starts an anonymous
+                # block.
+                self.names.append(names.fresh("b"))
+                self.starts.append(i)
+                open_block = True
+            if op in TERMINATORS:
+                self.ends.append(i + 1)
+                self.succs.append(successors(instr))
+                open_block = False
+        if open_block:
+            self.ends.append(len(instrs))
+            self.succs.append([])
+            self.implicit_ret = len(self.names) - 1
+
+        self.ops = _universe(op_ids)
+        self.vars = _universe(var_ids)
+
+    def __len__(self):
+        return len(self.op)
+
+    def instr(self, i):
+        """Instruction `i` in its dict form."""
+        out = dict(self.rest[i])
+        if self.op[i] != -1:
+            out["op"] = self.ops.elements[self.op[i]]
+        if self.dest[i] != -1:
+            out["dest"] = self.vars.elements[self.dest[i]]
+        if "args" in out:
+            elements = self.vars.elements
+            lo, hi = self.arg_offsets[i], self.arg_offsets[i + 1]
+            out["args"] = [elements[v] for v in self.args[lo:hi]]
+        return out
+
+    def to_instrs(self):
+        """The instructions in their dict form."""
+        return [self.instr(i) for i in range(len(self))]
+
+    def block(self, b):
+        """The instructions of block `b` (an index into `names`), in dict
+        form. Unlike `cfg.build_cfg`, this adds no terminators.
+        """
+        return [self.instr(i) for i in range(self.starts[b], self.ends[b])]
+
+    def graph(self):
+        """The `CompactCFG` of the blocks. A block that runs into a label
+        falls through to it.
+        """
+        return CompactCFG(self.names, self.succs)
+
+    @property
+    def exprs(self):
+        """The `get_expr` of every instruction, interned: a column of
+        expression IDs (-1 for none), the `Universe` of expressions, and
+        for each variable ID, the set of expressions that read it.
+        """
+        if self._exprs is None:
+            # Number the expressions by their IDs, and only spell them
+            # out once each.
+            ids = {}
+            column = array("i")
+            skip = {self.ops.index.get("const"), self.ops.index.get("id"), -1}
+            offsets, flat = self.arg_offsets.tolist(), self.args.tolist()
+            for i, (op, rest) in enumerate(zip(self.op.tolist(), self.rest)):
+                if op in skip or "args" not in rest:
+                    column.append(-1)
+                else:
+                    key = (op, *flat[offsets[i] : offsets[i + 1]])
+                    column.append(ids.setdefault(key, len(ids)))
+            ops, names = self.ops.elements, self.vars.elements
+            universe = bitvec.Universe()
+            readers = [set() for _ in names]
+            for key in ids:
+                e = universe.add((ops[key[0]], *[names[v] for v in key[1:]]))
+                for v in key[1:]:
+                    readers[v].add(e)
+            if self.implicit_ret != -1:
+                universe.add(_RET)
+            self._exprs = (column, universe, readers)
+        return self._exprs
+
+
+def _universe(ids):
+    """A `Universe` over a dict that already numbers its keys in order."""
+    universe = bitvec.Universe()
+    universe.index = ids
+    universe.elements = list(ids)
+    return universe
+
+
+def _bits(ids):
+    """The bit vector with the bits in `ids` set."""
+    bits = 0
+    for i in ids:
+        bits |= 1 << i
+    return bits
+
+
+# Fast versions of the gen/kill helpers in `df.py`, over block `b` of a
+# `ColumnarFunc`. They return bit vectors.
+
+
+def gen(func, b):
+    """Variables that are written in the block."""
+    bits = 0
+    for dest in func.dest[func.starts[b] : func.ends[b]]:
+        if dest != -1:
+            bits |= 1 << dest
+    return bits
+
+
+def use(func, b):
+    """Variables that are read before they are written in the block."""
+    defined = set()
+    used = 0
+    offsets, args, dests = func.arg_offsets, func.args, func.dest
+    for i in range(func.starts[b], func.ends[b]):
+        for arg in args[offsets[i] : offsets[i + 1]]:
+            if arg not in defined:
+                used |= 1 << arg
+        defined.add(dests[i])
+    return used
+
+
+def gen_avail_express(func, b):
+    """Expressions that are available at the end of the block."""
+    exprs, universe, readers = func.exprs
+    dests = func.dest
+    generated = set()
+    for i in range(func.starts[b], func.ends[b]):
+        if dests[i] != -1:
+            # Drop the expressions that read the variable just written.
+            generated -= readers[dests[i]]
+        if exprs[i] != -1:
+            generated.add(exprs[i])
+    if b == func.implicit_ret:
+        generated.add(universe.index[_RET])
+    return _bits(generated)
+
+
+def nothing(func, b):
+    """For analyses that never kill anything."""
+    return 0
+
+
+# The columnar counterpart of each gen/kill function in `df.py`, by name
+# (when `df.py` runs as a script, its functions aren't the ones in the
+# `df` module), and whether it works over expressions rather than
+# variables.
+FAST = {
+    "gen": (gen, False),
+    "kill": (gen, False),
+    "use": (use, False),
+    "nothing": (nothing, False),
+    "gen_avail_express": (gen_avail_express, True),
+    "killed_avail_express": (nothing, True),
+}
+
+
+def summarize(func, genkill):
+    """The columnar counterpart of `df.summarize` followed by
+    `df.bit_lower`: the (gen, kill) masks of every block of `func`, by
+    name, and the `Universe` they are numbered in.
+
+    Returns None if `genkill` has no columnar version.
+    """
+    try:
+        (gen_fn, exprs), (kill_fn, kill_exprs) = (
+            FAST[genkill.gen.__name__],
+            FAST[genkill.kill.__name__],
+        )
+    except KeyError:
+        return None
+    if exprs != kill_exprs:
+        return None
+    universe = func.exprs[1] if exprs else func.vars
+    masks = {
+        name: (gen_fn(func, b), kill_fn(func, b)) for b, name in enumerate(func.names)
+    }
+    return masks, universe
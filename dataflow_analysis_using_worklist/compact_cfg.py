@@ -0,0 +1,184 @@
+"""A compact, array-backed control flow graph.
+
+Block labels are interned to dense integer IDs (their position in the
+block map), and edges are stored CSR-style: the successors of block `i`
+are `succ_targets[succ_offsets[i]:succ_offsets[i + 1]]`, and likewise
+for predecessors. Traversals then index flat `array("i")`s instead of
+hashing label strings.
+
+`working_with_cfgs` uses this file through a symlink to it, so each
+assignment directory still runs on its own with one copy to edit.
+"""
+
+from array import array
+from collections import deque
+
+
+def _block_successors(names, blocks):
+    """Generate the successor labels of each block, in order.
+
+    Jumps and branches go to their labels, returns go nowhere, and any
+    other block falls through to the next one (if there is a next one).
+    """
+    for i, block in enumerate(blocks):
+        last = block[-1] if block else {}
+        op = last.get("op")
+        if op in ("jmp", "br") and "labels" in last:
+            yield last["labels"]
+        elif op == "ret" or i + 1 == len(names):
+            yield []
+        else:
+            yield [names[i + 1]]
+
+
+class CompactCFG:
+    """A CFG over integer block IDs with CSR successor/predecessor arrays.
+
+    The entry block is always ID 0.
+    """
+
+    __slots__ = (
+        "labels",
+        "ids",
+        "succ_offsets",
+        "succ_targets",
+        "pred_offsets",
+        "pred_targets",
+    )
+
+    def __init__(self, labels, succ_lists):
+        """Build the graph from the block labels, in order, and a list of
+        successor labels for each block.
+        """
+        self.labels = list(labels)
+        self.ids = {label: i for i, label in enumerate(self.labels)}
+
+        self.succ_offsets = array("i", [0])
+        self.succ_targets = array("i")
+        pred_lists = [[] for _ in self.labels]
+        for i, succs in enumerate(succ_lists):
+            for succ in succs:
+                j = self.ids[succ]
+                self.succ_targets.append(j)
+                pred_lists[j].append(i)
+            self.succ_offsets.append(len(self.succ_targets))
+
+        self.pred_offsets = array("i", [0])
+        self.pred_targets = array("i")
+        for preds in pred_lists:
+            self.pred_targets.extend(preds)
+            self.pred_offsets.append(len(self.pred_targets))
+
+    @classmethod
+    def from_succs(cls, succs):
+        """Build from a mapping of labels to successor label lists, like
+        `cfg.edges` or `mycfg.get_cfg` produce.
+        """
+        return cls(succs.keys(), succs.values())
+
+    @classmethod
+    def from_block_map(cls, blocks):
+        """Build from the output of `cfg.block_map`. Blocks without a
+        terminator fall through, as `cfg.add_terminators` would make
+        explicit.
+        """
+        names = list(blocks.keys())
+        return cls(names, _block_successors(names, list(blocks.values())))
+
+    @classmethod
+    def from_map_blocks(cls, name_to_block):
+        """Build from the output of `mycfg.map_blocks`, with the same
+        edges as `mycfg.get_cfg`. (Those blocks keep their leading label,
+        which never ends a block, so they fall through the same way.)
+        """
+        return cls.from_block_map(name_to_block)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def successors(self, i):
+        return self.succ_targets[self.succ_offsets[i] : self.succ_offsets[i + 1]]
+
+    def predecessors(self, i):
+        return self.pred_targets[self.pred_offsets[i] : self.pred_offsets[i + 1]]
+
+    def reverse_postorder(self, entry=0):
+        """Block IDs reachable from `entry`, in reverse postorder."""
+        offsets, targets = self.succ_offsets, self.succ_targets
+        visited = bytearray(len(self.labels))
+        visited[entry] = 1
+        postorder = []
+        # Each stack entry is a block and the position of its next edge.
+        stack = [[entry, offsets[entry]]]
+        while stack:
+            top = stack[-1]
+            node, pos = top
+            if pos < offsets[node + 1]:
+                top[1] = pos + 1
+                succ = targets[pos]
+                if not visited[succ]:
+                    visited[succ] = 1
+                    stack.append([succ, offsets[succ]])
+            else:
+                stack.pop()
+                postorder.append(node)
+        postorder.reverse()
+        return postorder
+
+    def immediate_dominators(self, entry=0, rpo=None):
+        """The immediate dominator of every block, by the iterative
+        Cooper-Harvey-Kennedy algorithm. The entry is its own immediate
+        dominator and unreachable blocks get -1.
+        """
+        if rpo is None:
+            rpo = self.reverse_postorder(entry)
+        rpo_number = [-1] * len(self.labels)
+        for n, node in enumerate(rpo):
+            rpo_number[node] = n
+        offsets, targets = self.pred_offsets, self.pred_targets
+
+        idoms = [-1] * len(self.labels)
+        idoms[entry] = entry
+        changed = True
+        while changed:
+            changed = False
+            for node in rpo[1:]:
+                new_idom = -1
+                for pos in range(offsets[node], offsets[node + 1]):
+                    pred = targets[pos]
+                    if idoms[pred] == -1:
+                        continue
+                    if new_idom == -1:
+                        new_idom = pred
+                        continue
+                    # Walk both fingers up the tree until they meet.
+                    a, b = pred, new_idom
+                    while a != b:
+                        while rpo_number[a] > rpo_number[b]:
+                            a = idoms[a]
+                        while rpo_number[b] > rpo_number[a]:
+                            b = idoms[b]
+                    new_idom = a
+                if idoms[node] != new_idom:
+                    idoms[node] = new_idom
+                    changed = True
+        return idoms
+
+    def path_lengths(self, entry=0):
+        """Breadth-first distances (in edges) from `entry`, and the BFS
+        tree parent of each block. Unreached blocks get -1 for both.
+        """
+        offsets, targets = self.succ_offsets, self.succ_targets
+        dist = array("i", [-1]) * len(self.labels)
+        parent = array("i", [-1]) * len(self.labels)
+        dist[entry] = 0
+        queue = deque([entry])
+        while queue:
+            node = queue.popleft()
+            for pos in range(offsets[node], offsets[node + 1]):
+                succ = targets[pos]
+                if dist[succ] == -1:
+                    dist[succ] = dist[node] + 1
+                    parent[succ] = node
+                    queue.append(succ)
+        return dist, parent
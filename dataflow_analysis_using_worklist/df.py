@@ -1,17 +1,32 @@
 from math import exp
 import sys
-import json
-from collections import namedtuple
-
-from form_blocks import form_blocks
+import argparse
+import heapq
+import multiprocessing
+import time
+from collections import namedtuple, Counter
+
+import bitvec
+import brilpack
 import cfg
+import resultcache
+from compact_cfg import CompactCFG
+from pmap import PMap, footprint
 
 # A single dataflow analysis consists of these part:
 # - forward: True for forward, False for backward.
 # - init: An initial value (bottom or top of the latice).
 # - merge: Take a list of values and produce a single value.
 # - transfer: The transfer function.
-Analysis = namedtuple("Analysis", ["forward", "init", "merge", "transfer"])
+# - genkill: Optionally, a `GenKill` describing the transfer function as
+#   `gen | (x - kill)`, which lets the analysis run on bit vectors.
+Analysis = namedtuple(
+    "Analysis", ["forward", "init", "merge", "transfer", "genkill"], defaults=[None]
+)
+
+# The local sets of a gen/kill analysis: functions from a block to the
+# elements it generates and the elements it kills.
+GenKill = namedtuple("GenKill", ["gen", "kill"])
 
 
 def union(sets):
@@ -33,50 +48,462 @@ def intersection(sets):
     return out
 
 
-def df_worklist(blocks, analysis):
+def df_worklist(blocks, analysis, summaries=None, stats=None, graph=None):
     """The worklist algorithm for iterating a data flow analysis to a
     fixed point.
+
+    If `summaries` is given, it maps block names to precomputed local
+    facts, which are handed to the transfer function instead of the
+    block's instructions.
+
+    The iteration runs over `graph`, a `CompactCFG` of the blocks, which
+    is built here if not given. Blocks are visited in reverse postorder
+    for forward analyses and in postorder for backward ones, and each
+    block sits in the worklist at most once.
+
+    If `stats` is a `Counter`, the run is profiled into it: "visits"
+    (blocks taken off the worklist), "merges" and "transfers" (calls to
+    each function), "merge_time" and "transfer_time" (seconds spent in
+    them), "passes" (sweeps through the block order until nothing
+    changed) and "worklist_peak" (the most blocks queued at once). With
+    no `stats`, none of this is measured.
     """
-    preds, succs = cfg.edges(blocks)
+    if graph is None:
+        graph = CompactCFG.from_block_map(blocks)
+    in_ = [analysis.init] * len(graph)
+    out = [analysis.init] * len(graph)
+    seeds = range(len(graph))
+    _iterate(
+        graph,
+        analysis,
+        blocks if summaries is None else summaries,
+        in_,
+        out,
+        seeds,
+        stats,
+    )
+    return _results(graph, analysis, in_, out)
+
+
+def df_incremental(
+    blocks,
+    analysis,
+    in_,
+    out,
+    changed,
+    edges=(),
+    summaries=None,
+    stats=None,
+    graph=None,
+):
+    """Bring the results of an earlier `df_worklist` run up to date after
+    some blocks were edited.
+
+    `in_` and `out` are the earlier results, `changed` names the blocks
+    that were edited or added, and `edges` lists (source, target) pairs
+    of edges that were added or removed. `blocks`, `summaries` and
+    `graph` describe the CFG as it is now.
+
+    Only the blocks downstream of a change (in the direction of the
+    analysis) can get new values. Those are reset to the initial value
+    and iterated again, with everything else kept from the earlier run,
+    so for monotone analyses the result is the same as a full run.
+    """
+    if graph is None:
+        graph = CompactCFG.from_block_map(blocks)
+    if not analysis.forward:
+        in_, out = out, in_
+        edges = [(target, source) for source, target in edges]
+    if analysis.forward:
+        offsets, targets = graph.succ_offsets, graph.succ_targets
+    else:
+        offsets, targets = graph.pred_offsets, graph.pred_targets
+
+    # Anything reachable from a change may need a new value.
+    seeds = {graph.ids[name] for name in changed if name in graph.ids}
+    seeds.update(graph.ids[target] for _, target in edges if target in graph.ids)
+    seeds.update(i for i, name in enumerate(graph.labels) if name not in out)
+    stack = list(seeds)
+    while stack:
+        node = stack.pop()
+        for pos in range(offsets[node], offsets[node + 1]):
+            succ = targets[pos]
+            if succ not in seeds:
+                seeds.add(succ)
+                stack.append(succ)
+
+    new_in = [analysis.init] * len(graph)
+    new_out = [analysis.init] * len(graph)
+    for i, name in enumerate(graph.labels):
+        if i not in seeds:
+            new_in[i] = in_[name]
+            new_out[i] = out[name]
+    _iterate(
+        graph,
+        analysis,
+        blocks if summaries is None else summaries,
+        new_in,
+        new_out,
+        seeds,
+        stats,
+    )
+    return _results(graph, analysis, new_in, new_out)
+
+
+def _iterate(graph, analysis, summaries, in_, out, seeds, stats):
+    """Run the worklist over `graph` until nothing changes, starting with
+    the block IDs in `seeds` queued. `in_` and `out` are lists indexed by
+    block ID, oriented along the analysis, and are updated in place.
+    """
+    if not len(graph):
+        return
+    local = [summaries[name] for name in graph.labels]
 
     # Switch between directions.
     if analysis.forward:
-        first_block = list(blocks.keys())[0]  # Entry.
-        in_edges = preds
-        out_edges = succs
+        in_offsets, in_targets = graph.pred_offsets, graph.pred_targets
+        out_offsets, out_targets = graph.succ_offsets, graph.succ_targets
     else:
-        first_block = list(blocks.keys())[-1]  # Exit.
-        in_edges = succs
-        out_edges = preds
-
-    # Initialize.
-    in_ = {first_block: analysis.init}
-    out = {node: analysis.init for node in blocks}
-
-    # Iterate.
-    worklist = list(blocks.keys())
+        in_offsets, in_targets = graph.succ_offsets, graph.succ_targets
+        out_offsets, out_targets = graph.pred_offsets, graph.pred_targets
+
+    # Order the blocks: RPO from the entry, then anything unreachable.
+    order = graph.reverse_postorder()
+    reached = set(order)
+    order += [node for node in range(len(graph)) if node not in reached]
+    if not analysis.forward:
+        order.reverse()
+    rank = [0] * len(graph)
+    for i, node in enumerate(order):
+        rank[node] = i
+
+    merge, transfer = analysis.merge, analysis.transfer
+    if stats is not None:
+        merge = _timed(merge, stats, "merge")
+        transfer = _timed(transfer, stats, "transfer")
+
+    # Iterate. The worklist is a heap of ranks; a sorted list is a heap.
+    worklist = sorted(rank[node] for node in seeds)
+    queued = bytearray(len(graph))
+    for node in seeds:
+        queued[node] = 1
+    last = len(graph)
     while worklist:
-        node = worklist.pop(0)
-
-        inval = analysis.merge(out[n] for n in in_edges[node])
+        if stats is not None:
+            stats["visits"] += 1
+            stats["worklist_peak"] = max(stats["worklist_peak"], len(worklist))
+            # Going back to an earlier block starts another pass.
+            if worklist[0] < last:
+                stats["passes"] += 1
+            last = worklist[0]
+        node = order[heapq.heappop(worklist)]
+        queued[node] = 0
+
+        preds = in_targets[in_offsets[node] : in_offsets[node + 1]]
+        inval = merge(out[n] for n in preds)
         in_[node] = inval
 
-        outval = analysis.transfer(blocks[node], inval)
+        outval = transfer(local[node], inval)
 
         if outval != out[node]:
             out[node] = outval
-            worklist += out_edges[node]
+            for succ in out_targets[out_offsets[node] : out_offsets[node + 1]]:
+                if not queued[succ]:
+                    queued[succ] = 1
+                    heapq.heappush(worklist, rank[succ])
+
+
+def _timed(fn, stats, name):
+    """Wrap `fn` to count its calls and time in `stats`."""
+
+    def timed(*args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            stats[name + "_time"] += time.perf_counter() - start
+            stats[name + "s"] += 1
+
+    return timed
+
+
+def add_stats(total, stats):
+    """Fold one run's `stats` into `total`: peaks take the maximum and
+    everything else adds up.
+    """
+    for key, value in stats.items():
+        if key.endswith("_peak"):
+            total[key] = max(total[key], value)
+        else:
+            total[key] += value
+
 
+def _results(graph, analysis, in_, out):
+    """Turn ID-indexed values back into (in, out) maps of block names."""
+    in_ = dict(zip(graph.labels, in_))
+    out = dict(zip(graph.labels, out))
     if analysis.forward:
         return in_, out
     else:
         return out, in_
 
 
-def fmt(val):
+# The bit-vector counterparts of the set merge functions.
+BIT_MERGES = {
+    union: bitvec.union,
+    intersection: bitvec.intersection,
+}
+
+
+def summarize(blocks, genkill, names=None):
+    """Compute the local (gen, kill) sets of every block once, so that
+    revisiting a block in the worklist doesn't rescan its instructions.
+
+    Only the blocks in `names` are summarized, if given.
+    """
+    if names is None:
+        names = blocks.keys()
+    return {
+        name: (set(genkill.gen(blocks[name])), set(genkill.kill(blocks[name])))
+        for name in names
+    }
+
+
+def genkill_transfer(local, val):
+    """The gen/kill transfer function, given a block's (gen, kill) sets."""
+    gen, kill = local
+    return gen.union(val - kill)
+
+
+def bit_lower(analysis, summaries, universe=None):
+    """Lower a summarized gen/kill analysis to one over bit vectors.
+
+    Returns the lowered analysis, the per-block (gen, kill) masks to pass
+    to `df_worklist` as summaries, and the `Universe` needed to decode
+    the results. Passing an existing `universe` keeps its numbering.
+    """
+    if universe is None:
+        universe = bitvec.Universe()
+    masks = {
+        name: (universe.encode(gen), universe.encode(kill))
+        for name, (gen, kill) in summaries.items()
+    }
+    lowered = analysis._replace(
+        init=universe.encode(analysis.init),
+        merge=BIT_MERGES[analysis.merge],
+        transfer=bitvec.transfer,
+    )
+    return lowered, masks, universe
+
+
+def uses_bits(analysis):
+    """Check whether an analysis can run on the bit-vector backend."""
+    return analysis.genkill is not None and analysis.merge in BIT_MERGES
+
+
+def prepare(blocks, analysis, bits=True):
+    """Get an analysis ready to run over a freshly formed CFG.
+
+    Gen/kill analyses get their block summaries computed up front (and
+    are lowered to bit vectors if `bits` allows it). Returns the analysis
+    to run, the summaries to hand `df_worklist` (or None), and the
+    `Universe` for decoding bit-vector results (or None).
+    """
+    if analysis.genkill is None:
+        return analysis, None, None
+    summaries = summarize(blocks, analysis.genkill)
+    if bits and uses_bits(analysis):
+        return bit_lower(analysis, summaries)
+    return analysis._replace(transfer=genkill_transfer), summaries, None
+
+
+def update_summaries(blocks, analysis, summaries, changed, universe=None):
+    """Refresh the summaries from `prepare` after editing the `changed`
+    blocks, for use with `df_incremental`. Summaries of removed blocks
+    are dropped. Bit-vector analyses need the `universe` from `prepare`,
+    so that earlier results still decode the same way.
+    """
+    if summaries is None:
+        return None
+    summaries = {name: local for name, local in summaries.items() if name in blocks}
+    changed = [name for name in changed if name in blocks]
+    fresh = summarize(blocks, analysis.genkill, changed)
+    if universe is not None:
+        fresh = bit_lower(analysis, fresh, universe)[1]
+    summaries.update(fresh)
+    return summaries
+
+
+class InstrFacts:
+    """Data flow facts at every instruction, expanded on demand from the
+    block-level results of a `df_worklist` run.
+
+    Point `(block, i)` is the program point just before instruction `i`
+    of `block`; `i == len(block)` is the point after its last
+    instruction. Facts are found by sweeping a block once in the
+    analysis's direction, from its in facts (out, for backward
+    analyses), one instruction at a time; the points at the ends of a
+    block always agree with its in and out facts. `block_points` keeps
+    every point of a block, while `raw` and `get` on a block that hasn't
+    been expanded only sweep as far as the point asked for. Bit-vector
+    results stay as ints until `get` decodes one.
+    """
+
+    def __init__(self, blocks, analysis, in_, out, universe=None):
+        """`analysis` is the analysis as written (not the one `prepare`
+        returned), and `universe` is the one `prepare` returned, if any.
+        """
+        self.blocks = blocks
+        self.analysis = analysis
+        self.in_ = in_
+        self.out = out
+        self.universe = universe
+        self.points = {}
+
+    def _stepper(self, start):
+        """Functions to step the analysis across one instruction from
+        `start`, and to get the fact reached so far. Sets are updated in
+        place, and only copied when a fact is asked for.
+        """
+        genkill = self.analysis.genkill
+        universe = self.universe
+        if genkill is None:
+            val = start
+
+            def step(instr):
+                nonlocal val
+                val = self.analysis.transfer([instr], val)
+
+            return step, lambda: val
+
+        if genkill.gen.__name__ == "gen_avail_express":
+            # An expression is available after an instruction if it was
+            # on the way in, or computed earlier in the block with no
+            # operand redefined since (see `gen_avail_express`).
+            # `readers` maps a variable to the generated expressions
+            # that read it.
+            readers = {}
+            if universe is not None:
+                generated = 0
+
+                def step(instr):
+                    nonlocal generated
+                    if "dest" in instr:
+                        generated &= ~readers.pop(instr["dest"], 0)
+                    expr = get_expr(instr)
+                    if expr:
+                        bit = 1 << universe.add(expr)
+                        generated |= bit
+                        for var in expr[1:]:
+                            readers[var] = readers.get(var, 0) | bit
+
+                return step, lambda: start | generated
+
+            generated = set()
+
+            def step(instr):
+                if "dest" in instr:
+                    generated.difference_update(readers.pop(instr["dest"], ()))
+                expr = get_expr(instr)
+                if expr:
+                    generated.add(expr)
+                    for var in expr[1:]:
+                        readers.setdefault(var, set()).add(expr)
+
+            return step, lambda: start | generated
+
+        if universe is not None:
+            val = start
+
+            def step(instr):
+                nonlocal val
+                gen, kill = genkill.gen([instr]), genkill.kill([instr])
+                val = bitvec.transfer(
+                    (universe.encode(gen), universe.encode(kill)), val
+                )
+
+            return step, lambda: val
+
+        val = set(start)
+
+        def step(instr):
+            val.difference_update(genkill.kill([instr]))
+            val.update(genkill.gen([instr]))
+
+        return step, lambda: set(val)
+
+    def _sweep(self, block, want):
+        """The facts at the points of `block` in `want`, by index, from
+        one sweep that stops once it has them all.
+        """
+        instrs = self.blocks[block]
+        n = len(instrs)
+        want = set(want)
+        facts = {}
+        if self.analysis.forward:
+            step, fact = self._stepper(self.in_[block])
+            points = range(n + 1)
+        else:
+            step, fact = self._stepper(self.out[block])
+            points = range(n, -1, -1)
+        for i in points:
+            if i in want:
+                facts[i] = fact()
+                if len(facts) == len(want):
+                    break
+            step(instrs[i] if self.analysis.forward else instrs[i - 1])
+        return facts
+
+    def block_points(self, block):
+        """The facts at every point of `block`, in program order."""
+        if block not in self.points:
+            n = len(self.blocks[block])
+            facts = self._sweep(block, range(n + 1))
+            self.points[block] = [facts[i] for i in range(n + 1)]
+        return self.points[block]
+
+    def raw(self, block, i):
+        """The fact at a point in its compact form (a bit vector, for
+        bit-vector analyses).
+        """
+        if block in self.points:
+            return self.points[block][i]
+        if i < 0:
+            i += len(self.blocks[block]) + 1
+        return self._sweep(block, [i])[i]
+
+    def get(self, block, i):
+        """The fact at a point, as a set (or whatever the analysis uses)."""
+        val = self.raw(block, i)
+        if self.universe is not None:
+            return self.universe.decode(val)
+        return val
+
+    def __getitem__(self, point):
+        block, i = point
+        return self.raw(block, i)
+
+
+def instr_facts(func, analysis, bits=True, stats=None):
+    """Form the CFG of one function, run `analysis` on it, and return the
+    block map along with its `InstrFacts`.
+    """
+    blocks, _, succs = cfg.build_cfg(func["instrs"])
+    graph = CompactCFG.from_succs(succs)
+
+    prepared, summaries, universe = prepare(blocks, analysis, bits)
+    in_, out = df_worklist(blocks, prepared, summaries, stats, graph)
+    return blocks, InstrFacts(blocks, analysis, in_, out, universe)
+
+
+def fmt(val, universe=None):
     """Guess a good way to format a data flow value. (Works for sets and
     dicts, at least.)
+
+    Bit vectors are decoded through `universe` first.
     """
+    if universe is not None:
+        val = universe.decode(val)
     if isinstance(val, set):
         if val:
 
@@ -92,7 +519,7 @@ def fmt(val):
             return ", ".join(v for v in sorted(formatted_elements))
         else:
             return "∅"
-    elif isinstance(val, dict):
+    elif isinstance(val, (dict, PMap)):
         if val:
             return ", ".join("{}: {}".format(k, v) for k, v in sorted(val.items()))
         else:
@@ -101,17 +528,169 @@ def fmt(val):
         return str(val)
 
 
-def run_df(bril, analysis):
-    for func in bril["functions"]:
-        # Form the CFG.
-        blocks = cfg.block_map(form_blocks(func["instrs"]))
-        cfg.add_terminators(blocks)
+def analyze_func(func, analysis, bits=True, stats=None, columnar=False):
+    """Form the CFG of one function, run `analysis` on it, and return the
+    formatted report as a list of lines.
 
-        in_, out = df_worklist(blocks, analysis)
-        for block in blocks:
-            print("{}:".format(block))
-            print("  in: ", fmt(in_[block]))
-            print("  out:", fmt(out[block]))
+    With `columnar`, gen/kill analyses that have a version in `colfunc`
+    run straight off the columnar layout of the instructions instead.
+    """
+    local = None
+    if columnar and bits and uses_bits(analysis):
+        import colfunc
+
+        layout = colfunc.ColumnarFunc(func["instrs"])
+        local = colfunc.summarize(layout, analysis.genkill)
+    if local is not None:
+        masks, universe = local
+        prepared, _, _ = bit_lower(analysis, {}, universe)
+        blocks = layout.names
+        in_, out = df_worklist(None, prepared, masks, stats, layout.graph())
+    elif callable(analysis):
+        blocks, _, succs = cfg.build_cfg(func["instrs"])
+        # A sparse analysis solves the whole function by itself.
+        universe = None
+        in_, out = analysis(blocks, func.get("args", []))
+    else:
+        blocks, _, succs = cfg.build_cfg(func["instrs"])
+        prepared, summaries, universe = prepare(blocks, analysis, bits)
+        graph = CompactCFG.from_succs(succs)
+        in_, out = df_worklist(blocks, prepared, summaries, stats, graph)
+    if stats is not None:
+        stats["value_bytes"] += footprint([*in_.values(), *out.values()])
+    lines = []
+    for block in blocks:
+        lines.append("{}:".format(block))
+        lines.append("  in:  {}".format(fmt(in_[block], universe)))
+        lines.append("  out: {}".format(fmt(out[block], universe)))
+    return lines
+
+
+def _analyze_job(job):
+    """Pool worker for `run_df`. Analyses hold lambdas, which can't be
+    pickled, so the job names its analysis instead.
+    """
+    func, name, bits, columnar = job
+    stats = Counter()
+    return analyze_func(func, get_analysis(name), bits, stats, columnar), stats
+
+
+def get_analysis(name):
+    """Look up an analysis by its command-line name. Besides the ones in
+    `REACH_DEFINITIONS`, "sccp" is sparse conditional constant
+    propagation, which solves a function by itself rather than through
+    an `Analysis`.
+    """
+    if name == "sccp":
+        # sccp builds on df_worklist, so it can only be imported late.
+        import sccp
+
+        return sccp.sccp
+    return REACH_DEFINITIONS[name]
+
+
+def run_df(bril, analysis, bits=True, stats=None, jobs=1, columnar=False, cache=None):
+    """Run an analysis on every function and print the results.
+
+    If `stats` is a dict, each function's profile (see `df_worklist`) is
+    stored in it as a `Counter` under the function's name.
+
+    With `jobs` > 1, functions are analyzed in a pool of that many
+    processes; `analysis` must then be a name for `get_analysis`. The
+    output is printed in function order, just like the serial run.
+
+    With a `cache` (a `resultcache.ResultCache`), each function's report
+    is looked up by the function's content first, and only the functions
+    that miss are analyzed; `analysis` must then be a name too.
+    """
+    funcs = bril["functions"]
+    reports = [None] * len(funcs)
+    keys = [None] * len(funcs)
+    if cache is not None:
+        for i, func in enumerate(funcs):
+            keys[i] = cache.key("df", analysis, _cache_data(func))
+            text = cache.get(keys[i])
+            if text is not None:
+                reports[i] = (text, Counter(cached=1))
+    todo = [i for i, report in enumerate(reports) if report is None]
+
+    if jobs <= 1:
+        if isinstance(analysis, str):
+            analysis = get_analysis(analysis)
+
+        def results():
+            for i in todo:
+                func_stats = None if stats is None else Counter()
+                lines = analyze_func(funcs[i], analysis, bits, func_stats, columnar)
+                yield lines, func_stats
+
+        _print_reports(funcs, reports, todo, results(), stats, cache, keys)
+        return
+
+    chunksize = max(1, len(todo) // (jobs * 4))
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(
+            _analyze_job,
+            ((funcs[i], analysis, bits, columnar) for i in todo),
+            chunksize,
+        )
+        _print_reports(funcs, reports, todo, results, stats, cache, keys)
+
+
+def _cache_data(func):
+    """What a function's report depends on."""
+    return {"args": func.get("args", []), "instrs": func.get("instrs", [])}
+
+
+def _print_reports(funcs, reports, todo, results, stats, cache, keys):
+    """Print every function's report in order, as the analyzed ones come
+    in from `results` (for the functions in `todo`), and cache those.
+    """
+    results = iter(results)
+    next_todo = iter(todo)
+    pending = next(next_todo, None)
+    for i, func in enumerate(funcs):
+        if i == pending:
+            lines, func_stats = next(results)
+            text = "\n".join(lines)
+            if cache is not None:
+                cache.put(keys[i], text)
+            pending = next(next_todo, None)
+        else:
+            text, func_stats = reports[i]
+        if text:
+            print(text)
+        if stats is not None:
+            stats[func["name"]] = func_stats
+
+
+def print_stats(stats, file=sys.stderr):
+    """Print the per-function profiles collected by `run_df`, then the
+    totals.
+    """
+    total = Counter()
+    for name, func_stats in stats.items():
+        add_stats(total, func_stats)
+        print("{}: {}".format(name, _fmt_stats(func_stats)), file=file)
+    print("total: {}".format(_fmt_stats(total)), file=file)
+
+
+def _fmt_stats(stats):
+    return (
+        "{} visits, {} passes, worklist peak {}, "
+        "{} merges ({:.6f}s), {} transfers ({:.6f}s), "
+        "{} lattice bytes held".format(
+            stats["visits"],
+            stats["passes"],
+            stats["worklist_peak"],
+            stats["merges"],
+            stats["merge_time"],
+            stats["transfers"],
+            stats["transfer_time"],
+            stats["value_bytes"],
+        )
+        + (", {} cached".format(stats["cached"]) if stats["cached"] else "")
+    )
 
 
 def gen(block):
@@ -162,30 +741,36 @@ def kill(block):
     return gen(block)
 
 
+def nothing(block):
+    """For analyses that never kill anything."""
+    return set()
+
+
 def cprop_transfer(block, in_vals):
-    out_vals = dict(in_vals)
+    # `PMap.set` shares structure with `in_vals`, and hands back the same
+    # map when nothing changes.
+    out_vals = in_vals
     for instr in block:
         if "dest" in instr:
             if instr["op"] == "const":
-                out_vals[instr["dest"]] = instr["value"]
+                out_vals = out_vals.set(instr["dest"], instr["value"])
             else:
-                out_vals[instr["dest"]] = "?"
+                out_vals = out_vals.set(instr["dest"], "?")
     return out_vals
 
 
+def cprop_meet(val, other):
+    return val if val == other else "?"
+
+
 def cprop_merge(vals_list):
-    out_vals = {}
+    out_vals = None
     for vals in vals_list:
-        for name, val in vals.items():
-            if val == "?":
-                out_vals[name] = "?"
-            else:
-                if name in out_vals:
-                    if out_vals[name] != val:
-                        out_vals[name] = "?"
-                else:
-                    out_vals[name] = val
-    return out_vals
+        if out_vals is None:
+            out_vals = vals
+        else:
+            out_vals = out_vals.merge(vals, cprop_meet)
+    return PMap() if out_vals is None else out_vals
 
 
 GEN_ANALYSES = {
@@ -196,6 +781,7 @@ GEN_ANALYSES = {
         init=set(),
         merge=union,
         transfer=lambda block, in_: in_.union(gen(block)),
+        genkill=GenKill(gen, nothing),
     ),
     # Live variable analysis: the variables that are both defined at a
     # given point and might be read along some path in the future.
@@ -204,11 +790,12 @@ GEN_ANALYSES = {
         init=set(),
         merge=union,
         transfer=lambda block, out: use(block).union(out - gen(block)),
+        genkill=GenKill(use, gen),
     ),
     # A simple constant propagation pass.
     "cprop": Analysis(
         True,
-        init={},
+        init=PMap(),
         merge=cprop_merge,
         transfer=cprop_transfer,
     ),
@@ -220,6 +807,7 @@ REACH_DEFINITIONS = {
         init=set(),
         merge=union,
         transfer=lambda block, in_: in_.union(gen(block)),
+        genkill=GenKill(gen, nothing),
     ),
     # Reaching Definitions Analysis
     # forward
@@ -228,6 +816,7 @@ REACH_DEFINITIONS = {
         init=set(),
         merge=union,
         transfer=lambda block, in_: gen(block).union(in_ - kill(block)),
+        genkill=GenKill(gen, kill),
     ),
     # Available Expressions Analysis
     "available": Analysis(
@@ -237,6 +826,7 @@ REACH_DEFINITIONS = {
         transfer=lambda block, in_: gen_avail_express(block).union(
             in_ - killed_avail_express(block)
         ),
+        genkill=GenKill(gen_avail_express, killed_avail_express),
     ),
     # Live variable analysis: the variables that are both defined at a
     # given point and might be read along some path in the future.
@@ -245,17 +835,73 @@ REACH_DEFINITIONS = {
         init=set(),
         merge=union,
         transfer=lambda block, out: use(block).union(out - gen(block)),
+        genkill=GenKill(use, gen),
     ),
     # A simple constant propagation pass.
     "cprop": Analysis(
         True,
-        init={},
+        init=PMap(),
         merge=cprop_merge,
         transfer=cprop_transfer,
     ),
 }
 
 if __name__ == "__main__":
-    bril = json.load(sys.stdin)
-    # run_df(bril, GEN_ANALYSES[sys.argv[1]])
-    run_df(bril, REACH_DEFINITIONS[sys.argv[1]])
+    parser = argparse.ArgumentParser(
+        description="Run a data flow analysis on bril JSON input"
+    )
+    parser.add_argument("analysis", choices=sorted([*REACH_DEFINITIONS, "sccp"]))
+    parser.add_argument(
+        "file",
+        nargs="?",
+        help="Bril JSON or packed file to analyze. If not provided, reads from stdin",
+    )
+    parser.add_argument(
+        "-s",
+        "--stats",
+        action="store_true",
+        help="Profile each function's analysis and report it on stderr.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Analyze functions in this many processes.",
+    )
+    parser.add_argument(
+        "-c",
+        "--columnar",
+        action="store_true",
+        help="Run gen/kill analyses over columnar instruction storage.",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Reuse the reports of unchanged functions from this directory.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="Evict the least recently used reports past this size.",
+    )
+    args = parser.parse_args()
+
+    bril = brilpack.load_bril(args.file)
+    stats = {} if args.stats else None
+    cache = None
+    if args.cache:
+        cache = resultcache.ResultCache(args.cache, args.cache_size * 1024 * 1024)
+    # run_df(bril, GEN_ANALYSES[args.analysis])
+    run_df(
+        bril,
+        args.analysis,
+        stats=stats,
+        jobs=args.jobs,
+        columnar=args.columnar,
+        cache=cache,
+    )
+    if stats is not None:
+        print_stats(stats)
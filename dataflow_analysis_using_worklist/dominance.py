@@ -0,0 +1,207 @@
+"""Depth first search and dominators of a CFG, given as a mapping
+{node: [successors]} (or a `CompactCFG`, where noted). Dominance queries
+take O(1) through a pre/post numbering of the dominator tree.
+
+`mycfg.py`, `loops.py` and `manager.py` all build on this module.
+`working_with_cfgs` uses this file through a symlink to it.
+"""
+
+from collections import namedtuple
+
+from compact_cfg import CompactCFG
+
+# results of a single depth first traversal of a cfg
+# - preorder/postorder: every node, entry's tree first then any others
+# - rpo: reverse postorder of the nodes reachable from the entry
+# - back_edges: list of edges [u, v] where u -> v is a back edge
+# - edge_kinds: {(u, v): "tree" | "back" | "forward" | "cross"}
+DepthFirstSearch = namedtuple(
+    "DepthFirstSearch", ["preorder", "postorder", "rpo", "back_edges", "edge_kinds"]
+)
+
+
+def depth_first_search(cfg, entry, debug=False) -> DepthFirstSearch:
+    """
+    desc: one iterative DFS over a CFG that numbers the nodes and
+          classifies every edge, without recursion so long chains
+          of blocks can't hit python's recursion limit
+
+    param: cfg(dict)  = mapping{node: [successors]}
+    param: entry(str) = starting node
+
+    returns: DepthFirstSearch(preorder, postorder, rpo, back_edges, edge_kinds)
+    """
+
+    preorder = []
+    postorder = []
+    back_edges = []
+    edge_kinds = {}
+    pre_number = {}
+    visiting = set()
+    rpo_list = None
+
+    roots = [entry] + [n for n in cfg if n != entry]
+    for root in roots:
+        if root in pre_number:
+            continue
+        pre_number[root] = len(preorder)
+        preorder.append(root)
+        visiting.add(root)
+        stack = [(root, iter(cfg.get(root, [])))]
+
+        while stack:
+            a_node, successors = stack[-1]
+            for successor in successors:
+                if successor not in pre_number:
+                    edge_kinds[(a_node, successor)] = "tree"
+                    pre_number[successor] = len(preorder)
+                    preorder.append(successor)
+                    visiting.add(successor)
+                    stack.append((successor, iter(cfg.get(successor, []))))
+                    break
+                elif successor in visiting:
+                    if debug:
+                        print(f"Found back edge:\n{successor}\n")
+                    edge_kinds[(a_node, successor)] = "back"
+                    back_edges.append([a_node, successor])
+                elif pre_number[a_node] < pre_number[successor]:
+                    edge_kinds[(a_node, successor)] = "forward"
+                else:
+                    edge_kinds[(a_node, successor)] = "cross"
+            else:
+                # every successor explored, the node is finished
+                stack.pop()
+                visiting.discard(a_node)
+                postorder.append(a_node)
+
+        if rpo_list is None:
+            rpo_list = postorder[::-1]
+
+    if debug:
+        print(f"The po list:\n{postorder}\n\nThe rpo list:\n{rpo_list}\n")
+        print(f"The back edges list:\n{back_edges}\n")
+
+    return DepthFirstSearch(preorder, postorder, rpo_list, back_edges, edge_kinds)
+
+
+def reverse_postorder(cfg, entry, debug=False) -> list[str]:
+    """
+    desc: compute RPO for a CFG
+
+    param: cfg(dict)  = mapping{node: [successors]}, or a CompactCFG
+    param: entry(str) = starting node
+
+    returns: list[nodes in reverse post order]
+    """
+    if isinstance(cfg, CompactCFG):
+        return [cfg.labels[i] for i in cfg.reverse_postorder(cfg.ids[entry])]
+    return depth_first_search(cfg, entry, debug).rpo
+
+
+def find_immediate_dominators(cfg, entry_node, debug=False, rpo=None) -> dict:
+    """
+    desc: compute the immediate dominator of every reachable node with
+          the iterative Cooper-Harvey-Kennedy algorithm over RPO numbers
+
+    param: cfg(dict)  = mapping{node: [successors]}, or a CompactCFG
+    param: entry_node(str) = starting node
+    param: rpo(list) = reverse postorder, if a DFS was already done
+
+    returns: dict {node: immediate dominator}, the entry maps to itself
+             and unreachable nodes are left out
+    """
+    if isinstance(cfg, CompactCFG):
+        idoms = cfg.immediate_dominators(cfg.ids[entry_node])
+        return {
+            cfg.labels[i]: cfg.labels[idom]
+            for i, idom in enumerate(idoms)
+            if idom != -1
+        }
+
+    if rpo is None:
+        rpo = reverse_postorder(cfg, entry_node)
+    rpo_number = {n: i for i, n in enumerate(rpo)}
+
+    predecessors = {n: [] for n in cfg}
+    for n in rpo:
+        for successor in cfg.get(n, []):
+            predecessors[successor].append(n)
+
+    def intersect(a, b):
+        # walk up the (partial) dominator tree until the fingers meet
+        while a != b:
+            while rpo_number[a] > rpo_number[b]:
+                a = idoms[a]
+            while rpo_number[b] > rpo_number[a]:
+                b = idoms[b]
+        return a
+
+    idoms = {entry_node: entry_node}
+    changed = True
+    while changed:
+        changed = False
+        for a_node in rpo[1:]:
+            new_idom = None
+            for predecessor in predecessors[a_node]:
+                if predecessor in idoms:
+                    if new_idom is None:
+                        new_idom = predecessor
+                    else:
+                        new_idom = intersect(predecessor, new_idom)
+            if idoms.get(a_node) != new_idom:
+                idoms[a_node] = new_idom
+                changed = True
+
+    if debug:
+        print(f"The immediate dominators:\n{idoms}\n")
+
+    return idoms
+
+
+def dominator_intervals(idoms, entry_node) -> tuple[dict, dict]:
+    """
+    desc: number the dominator tree with DFS pre/post order so that
+          dominance queries take O(1)
+
+    param: idoms(dict) = mapping{node: immediate dominator}
+    param: entry_node(str) = root of the dominator tree
+
+    returns: (pre, post) dicts {node: number}
+    """
+    children = {n: [] for n in idoms}
+    for n, idom in idoms.items():
+        if n != entry_node:
+            children[idom].append(n)
+
+    pre = {}
+    post = {}
+    counter = 0
+    stack = [(entry_node, False)]
+    while stack:
+        a_node, done = stack.pop()
+        if done:
+            post[a_node] = counter
+        else:
+            pre[a_node] = counter
+            stack.append((a_node, True))
+            stack.extend((child, False) for child in children[a_node])
+        counter += 1
+
+    return pre, post
+
+
+def dominates(a, b, intervals) -> bool:
+    """
+    desc: check whether node a dominates node b
+
+    param: intervals(tuple) = (pre, post) from dominator_intervals
+
+    returns: True if a dominates b; every node dominates an
+             unreachable node, as no path from the entry reaches it
+    """
+    pre, post = intervals
+    if b not in pre:
+        return True
+    if a not in pre:
+        return False
+    return pre[a] <= pre[b] and post[b] <= post[a]
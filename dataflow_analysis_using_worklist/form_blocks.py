@@ -1,6 +1,5 @@
 """Create and print out the basic blocks in a Bril function."""
 
-import json
 import sys
 
 # Instructions that terminate a basic block.
@@ -66,4 +65,6 @@ def print_blocks(bril):
 
 
 if __name__ == "__main__":
-    print_blocks(json.load(sys.stdin))
+    import brilpack
+
+    print_blocks(brilpack.load_bril(sys.argv[1] if len(sys.argv) > 1 else None))
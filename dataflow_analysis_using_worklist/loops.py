@@ -0,0 +1,152 @@
+from collections import namedtuple
+
+from dominance import (
+    depth_first_search,
+    dominates,
+    dominator_intervals,
+    find_immediate_dominators,
+)
+
+# natural loops and the loop nesting forest of a cfg, used by mycfg.py
+# and the analysis manager (working_with_cfgs uses this file through a
+# symlink to it)
+
+# a single natural loop
+# - header: the block every path into the loop goes through
+# - blocks: frozenset of every block in the loop, nested loops included
+# - latches: blocks with a back edge to the header
+# - exits: list of edges [u, v] leaving the loop, u inside and v outside
+# - parent: header of the innermost enclosing loop, or None
+# - children: headers of the loops directly nested in this one
+# - depth: 1 for an outermost loop, 2 for a loop inside it, ...
+Loop = namedtuple(
+    "Loop", ["header", "blocks", "latches", "exits", "parent", "children", "depth"]
+)
+
+# the loops of one cfg
+# - loops: {header: Loop}, outer loops before the loops inside them
+# - roots: headers of the outermost loops
+# - innermost: {block: header of the innermost loop containing it}
+LoopForest = namedtuple("LoopForest", ["loops", "roots", "innermost"])
+
+
+def find_loops(cfg, entry, debug=False, dfs=None, idoms=None) -> LoopForest:
+    """
+    desc: find the natural loops of a cfg and how they nest
+
+          a back edge u -> v whose target dominates its source makes v
+          a loop header, and all back edges into the same header form
+          one loop. headers are handled innermost first (in reverse DFS
+          preorder), and every finished loop is collapsed into its
+          header with a union-find, so the walk that collects an outer
+          loop steps over inner loops in one hop. that keeps finding
+          the loops near-linear in the size of the cfg. back edges in
+          irreducible regions, whose target doesn't dominate the
+          source, don't make loops
+
+    param: cfg(dict)  = mapping{node: [successors]}
+    param: entry(str) = starting node
+    param: dfs(DepthFirstSearch) = from depth_first_search, if already done
+    param: idoms(dict) = from find_immediate_dominators, if already done
+
+    returns: LoopForest(loops, roots, innermost)
+    """
+    if dfs is None:
+        dfs = depth_first_search(cfg, entry)
+    if idoms is None:
+        idoms = find_immediate_dominators(cfg, entry, rpo=dfs.rpo)
+    intervals = dominator_intervals(idoms, entry)
+
+    latches = {}
+    for u, v in dfs.back_edges:
+        if u in idoms and dominates(v, u, intervals):
+            latches.setdefault(v, []).append(u)
+
+    predecessors = {n: [] for n in cfg}
+    for a_node in dfs.rpo:
+        for successor in cfg.get(a_node, []):
+            predecessors[successor].append(a_node)
+
+    # union-find: every block points towards the header of the outermost
+    # loop found so far that contains it
+    collapsed = {}
+
+    def find(a_node):
+        root = a_node
+        while root in collapsed:
+            root = collapsed[root]
+        while a_node != root:
+            collapsed[a_node], a_node = root, collapsed[a_node]
+        return root
+
+    pre_number = {n: i for i, n in enumerate(dfs.preorder)}
+    headers = sorted(latches, key=pre_number.get, reverse=True)
+    blocks = {}
+    parent = {}
+    children = {header: [] for header in headers}
+    innermost = {}
+
+    for header in headers:
+        body = set()
+        worklist = [find(u) for u in latches[header]]
+        while worklist:
+            a_node = worklist.pop()
+            if a_node == header or a_node in body:
+                continue
+            body.add(a_node)
+            for predecessor in predecessors[a_node]:
+                representative = find(predecessor)
+                if representative != header and representative not in body:
+                    worklist.append(representative)
+
+        loop_blocks = {header}
+        innermost[header] = header
+        for a_node in body:
+            collapsed[a_node] = header
+            if a_node in children:
+                # an inner loop, already finished
+                parent[a_node] = header
+                children[header].append(a_node)
+                loop_blocks |= blocks[a_node]
+            else:
+                innermost[a_node] = header
+                loop_blocks.add(a_node)
+        blocks[header] = frozenset(loop_blocks)
+
+        if debug:
+            print(f"Loop at '{header}':\n{sorted(loop_blocks)}\n")
+
+    loops = {}
+    for header in reversed(headers):
+        enclosing = parent.get(header)
+        exits = [
+            [a_node, successor]
+            for a_node in sorted(blocks[header], key=pre_number.get)
+            for successor in cfg.get(a_node, [])
+            if successor not in blocks[header]
+        ]
+        loops[header] = Loop(
+            header,
+            blocks[header],
+            latches[header],
+            exits,
+            enclosing,
+            sorted(children[header], key=pre_number.get),
+            loops[enclosing].depth + 1 if enclosing else 1,
+        )
+
+    roots = [header for header in loops if header not in parent]
+    return LoopForest(loops, roots, innermost)
+
+
+def loop_depth(forest, a_node) -> int:
+    """
+    desc: how many loops a block is nested in
+
+    param: forest(LoopForest) = from find_loops
+    param: a_node(str) = block
+
+    returns: depth of the innermost loop containing the block, 0 if none
+    """
+    header = forest.innermost.get(a_node)
+    return forest.loops[header].depth if header is not None else 0
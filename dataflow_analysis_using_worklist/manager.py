@@ -0,0 +1,278 @@
+"""Lazily computed, cached analyses of a program's functions.
+
+An `AnalysisManager` hands out analyses by function name and analysis
+name, computing each one the first time it is asked for (along with
+whatever it builds on) and keeping it after that:
+
+    blocks      the block map, from `cfg.build_cfg`
+    edges       its (preds, succs) mappings
+    graph       the `CompactCFG` of the edges
+    dfs         the `dominance.DepthFirstSearch` from the entry block
+    rpo         block names in reverse postorder
+    dominators  {block: immediate dominator}, for reachable blocks
+    intervals   the dominator tree numbering, for `dominance.dominates`
+    back_edges  [source, target] edges that go back in the rpo
+    loops       the `loops.LoopForest` of the natural loops
+    reducible   whether every back edge's target dominates its source
+    live        a `Solution` of the `live` analysis
+    reach       a `Solution` of the `reach` analysis
+
+A pass that edits the block map in place calls `invalidate` with the
+blocks whose instructions it changed and the edges it added or removed.
+Only the analyses that depend on what changed are dropped. Data flow
+solutions are not recomputed from scratch, but brought up to date with
+`df_incremental` the next time they are asked for.
+"""
+
+from collections import namedtuple, Counter
+
+import cfg
+from brilpack import functions_by_name
+from compact_cfg import CompactCFG
+from dominance import (
+    DepthFirstSearch,
+    depth_first_search,
+    dominates,
+    dominator_intervals,
+)
+from loops import LoopForest, find_loops
+from df import REACH_DEFINITIONS, df_incremental, df_worklist, prepare, update_summaries
+
+# How to get one analysis:
+# - compute: function (manager, func name) -> the result.
+# - requires: names of the analyses `compute` asks the manager for.
+# - reads: what about the block map the result depends on directly,
+#   "instrs" (the instructions in blocks) and/or "edges".
+# - update: optionally, function (manager, func name, old result,
+#   changed blocks, changed edges) -> the result, brought up to date.
+Provider = namedtuple("Provider", ["compute", "requires", "reads", "update"])
+
+
+class Solution(
+    namedtuple("Solution", ["in_", "out", "universe", "analysis", "summaries"])
+):
+    """The result of a gen/kill data flow analysis. `in_` and `out` map
+    block names to bit vectors of `universe`; `analysis` and `summaries`
+    are what `df.prepare` returned, kept for incremental updates.
+    """
+
+    def at(self, block):
+        """The (in, out) sets of a block."""
+        decode = self.universe.decode
+        return decode(self.in_[block]), decode(self.out[block])
+
+
+def _blocks(manager, name):
+    blocks, preds, succs = cfg.build_cfg(manager.funcs[name].get("instrs", []))
+    # The edges come for free with the blocks.
+    manager.results[name, "edges"] = (preds, succs)
+    return blocks
+
+
+def _edges(manager, name):
+    return cfg.edges(manager.get(name, "blocks"))
+
+
+def _graph(manager, name):
+    _, succs = manager.get(name, "edges")
+    return CompactCFG.from_succs(succs)
+
+
+def _dfs(manager, name):
+    _, succs = manager.get(name, "edges")
+    if not succs:
+        return DepthFirstSearch([], [], [], [], {})
+    return depth_first_search(succs, next(iter(succs)))
+
+
+def _rpo(manager, name):
+    return manager.get(name, "dfs").rpo
+
+
+def _dominators(manager, name):
+    graph = manager.get(name, "graph")
+    rpo = [graph.ids[block] for block in manager.get(name, "rpo")]
+    if not rpo:
+        return {}
+    idoms = graph.immediate_dominators(rpo=rpo)
+    return {
+        graph.labels[node]: graph.labels[idom]
+        for node, idom in enumerate(idoms)
+        if idom != -1
+    }
+
+
+def _intervals(manager, name):
+    rpo = manager.get(name, "rpo")
+    if not rpo:
+        return {}, {}
+    return dominator_intervals(manager.get(name, "dominators"), rpo[0])
+
+
+def _back_edges(manager, name):
+    dfs = manager.get(name, "dfs")
+    reachable = set(dfs.rpo)
+    return [edge for edge in dfs.back_edges if edge[0] in reachable]
+
+
+def _loops(manager, name):
+    _, succs = manager.get(name, "edges")
+    if not succs:
+        return LoopForest({}, [], {})
+    return find_loops(
+        succs,
+        next(iter(succs)),
+        dfs=manager.get(name, "dfs"),
+        idoms=manager.get(name, "dominators"),
+    )
+
+
+def _reducible(manager, name):
+    intervals = manager.get(name, "intervals")
+    return all(
+        dominates(header, source, intervals)
+        for source, header in manager.get(name, "back_edges")
+    )
+
+
+def _solver(analysis):
+    """The `Provider` of a gen/kill analysis's `Solution`."""
+
+    def compute(manager, name):
+        blocks = manager.get(name, "blocks")
+        prepared, summaries, universe = prepare(blocks, analysis)
+        graph = manager.get(name, "graph")
+        in_, out = df_worklist(blocks, prepared, summaries, graph=graph)
+        return Solution(in_, out, universe, prepared, summaries)
+
+    def update(manager, name, old, changed, edges):
+        blocks = manager.get(name, "blocks")
+        summaries = update_summaries(
+            blocks, analysis, old.summaries, changed, old.universe
+        )
+        in_, out = df_incremental(
+            blocks,
+            old.analysis,
+            old.in_,
+            old.out,
+            changed,
+            edges,
+            summaries,
+            graph=manager.get(name, "graph"),
+        )
+        return old._replace(in_=in_, out=out, summaries=summaries)
+
+    return Provider(compute, ("blocks", "graph"), ("instrs",), update)
+
+
+PROVIDERS = {
+    "blocks": Provider(_blocks, (), (), None),
+    "edges": Provider(_edges, ("blocks",), ("edges",), None),
+    "graph": Provider(_graph, ("edges",), (), None),
+    "dfs": Provider(_dfs, ("edges",), (), None),
+    "rpo": Provider(_rpo, ("dfs",), (), None),
+    "dominators": Provider(_dominators, ("graph", "rpo"), (), None),
+    "intervals": Provider(_intervals, ("dominators", "rpo"), (), None),
+    "back_edges": Provider(_back_edges, ("dfs",), (), None),
+    "loops": Provider(_loops, ("edges", "dfs", "dominators"), (), None),
+    "reducible": Provider(_reducible, ("intervals", "back_edges"), (), None),
+    "live": _solver(REACH_DEFINITIONS["live"]),
+    "reach": _solver(REACH_DEFINITIONS["reach"]),
+}
+
+
+def _dependents(providers):
+    """For every analysis, the analyses that require it, directly or
+    not.
+    """
+    direct = {name: set() for name in providers}
+    for name, provider in providers.items():
+        for required in provider.requires:
+            direct[required].add(name)
+    closed = {}
+    for name in providers:
+        seen = set()
+        stack = list(direct[name])
+        while stack:
+            dependent = stack.pop()
+            if dependent not in seen:
+                seen.add(dependent)
+                stack.extend(direct[dependent])
+        closed[name] = seen
+    return closed
+
+
+class AnalysisManager:
+    """The analyses of every function of a program, computed on demand
+    and kept until a pass invalidates them.
+
+    `stats` counts, per analysis, how often a result was "computed",
+    "updated" incrementally, or a "hit" in the cache.
+    """
+
+    def __init__(self, bril, providers=PROVIDERS):
+        # Packed programs only unpack the functions that are analyzed.
+        self.funcs = functions_by_name(bril)
+        self.providers = providers
+        self.dependents = _dependents(providers)
+        self.results = {}
+        # Changes not yet applied to results that can be updated, as
+        # (changed blocks, changed edges).
+        self.pending = {}
+        self.stats = Counter()
+
+    def get(self, name, analysis):
+        """The result of `analysis` on the function called `name`."""
+        key = name, analysis
+        provider = self.providers[analysis]
+        if key in self.pending:
+            changed, edges = self.pending.pop(key)
+            self.results[key] = provider.update(
+                self, name, self.results[key], changed, edges
+            )
+            self.stats[analysis, "updated"] += 1
+        elif key in self.results:
+            self.stats[analysis, "hit"] += 1
+        else:
+            self.results[key] = provider.compute(self, name)
+            self.stats[analysis, "computed"] += 1
+        return self.results[key]
+
+    def invalidate(self, name, blocks=(), edges=()):
+        """Record that a pass edited the block map of function `name`:
+        it changed (or added) the instructions of `blocks`, and added or
+        removed the (source, target) `edges`. Removing a block counts as
+        removing its edges.
+
+        Analyses that depend on what changed are dropped, except those
+        that can be updated, which are brought up to date when next
+        asked for.
+        """
+        blocks, edges = list(blocks), list(edges)
+        stale = set()
+        for analysis, provider in self.providers.items():
+            if (blocks and "instrs" in provider.reads) or (
+                edges and "edges" in provider.reads
+            ):
+                stale.add(analysis)
+                stale |= self.dependents[analysis]
+
+        for analysis in stale:
+            key = name, analysis
+            if key not in self.results:
+                continue
+            if self.providers[analysis].update is None:
+                del self.results[key]
+                self.pending.pop(key, None)
+            else:
+                changed, pending_edges = self.pending.setdefault(key, (set(), []))
+                changed.update(blocks)
+                pending_edges.extend(edges)
+
+    def forget(self, name):
+        """Drop every analysis of function `name`, for when its
+        instructions were replaced outright.
+        """
+        for key in [key for key in self.results if key[0] == name]:
+            del self.results[key]
+            self.pending.pop(key, None)
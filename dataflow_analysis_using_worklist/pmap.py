@@ -0,0 +1,314 @@
+"""A persistent hash map for dict-valued data flow facts.
+
+`PMap` is a hash array mapped trie (HAMT). Updating a key builds a new
+map that shares every untouched subtree with the old one, and an update
+that doesn't change anything returns the very same map. That makes the
+common cases in a data flow analysis cheap: a transfer function that
+redefines a few variables copies only a few small nodes, comparing a
+block's new value to its old one usually stops at an identity check,
+and merging two maps that came from the same ancestor only walks the
+subtrees where they differ.
+"""
+
+import sys
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+
+
+def _hash(key):
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+def _popcount(n):
+    return bin(n).count("1")
+
+
+def _same(a, b):
+    """Values are only interchangeable if they are equal and the same
+    type (so that `1` doesn't stand in for `True`).
+    """
+    return a is b or (a == b and type(a) is type(b))
+
+
+class _Leaf:
+    __slots__ = ("hash", "key", "value")
+
+    def __init__(self, h, key, value):
+        self.hash = h
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """Leaves whose hashes agree in every bit."""
+
+    __slots__ = ("hash", "leaves")
+
+    def __init__(self, h, leaves):
+        self.hash = h
+        self.leaves = leaves
+
+
+class _Node:
+    """A trie node: `bitmap` marks which of the 32 slots at this level are
+    occupied, and `entries` holds them in order.
+    """
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+_EMPTY = _Node(0, ())
+
+
+def _pair(a, b, shift):
+    """A subtree holding two leaves (or collisions) with different keys."""
+    if shift >= _HASH_BITS:
+        leaves = (a.leaves if isinstance(a, _Collision) else (a,)) + (
+            b.leaves if isinstance(b, _Collision) else (b,)
+        )
+        return _Collision(a.hash, leaves)
+    bit_a = 1 << ((a.hash >> shift) & _MASK)
+    bit_b = 1 << ((b.hash >> shift) & _MASK)
+    if bit_a == bit_b:
+        return _Node(bit_a, (_pair(a, b, shift + _BITS),))
+    entries = (a, b) if bit_a < bit_b else (b, a)
+    return _Node(bit_a | bit_b, entries)
+
+
+def _get(node, h, key, shift, default):
+    while True:
+        if isinstance(node, _Leaf):
+            return node.value if node.key == key else default
+        if isinstance(node, _Collision):
+            for leaf in node.leaves:
+                if leaf.key == key:
+                    return leaf.value
+            return default
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return default
+        node = node.entries[_popcount(node.bitmap & (bit - 1))]
+        shift += _BITS
+
+
+def _set(node, leaf, shift):
+    """Insert `leaf` below `node`. Returns the same node if nothing
+    changed.
+    """
+    if isinstance(node, _Leaf):
+        if node.key == leaf.key:
+            return node if _same(node.value, leaf.value) else leaf
+        return _pair(node, leaf, shift)
+    if isinstance(node, _Collision):
+        if node.hash != leaf.hash:
+            return _pair(node, leaf, shift)
+        for i, old in enumerate(node.leaves):
+            if old.key == leaf.key:
+                if _same(old.value, leaf.value):
+                    return node
+                return _Collision(
+                    node.hash, node.leaves[:i] + (leaf,) + node.leaves[i + 1 :]
+                )
+        return _Collision(node.hash, node.leaves + (leaf,))
+
+    bit = 1 << ((leaf.hash >> shift) & _MASK)
+    i = _popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        entries = node.entries[:i] + (leaf,) + node.entries[i:]
+        return _Node(node.bitmap | bit, entries)
+    child = node.entries[i]
+    new_child = _set(child, leaf, shift + _BITS)
+    if new_child is child:
+        return node
+    return _Node(node.bitmap, node.entries[:i] + (new_child,) + node.entries[i + 1 :])
+
+
+def _leaves(node):
+    if isinstance(node, _Leaf):
+        yield node
+    elif isinstance(node, _Collision):
+        yield from node.leaves
+    else:
+        for entry in node.entries:
+            yield from _leaves(entry)
+
+
+def _merge(a, b, combine, shift):
+    """Merge two subtrees at the same position, keeping keys from either
+    side and calling `combine` on keys in both. Identical subtrees are
+    returned as they are, without looking inside.
+    """
+    if a is b:
+        return a
+    if not isinstance(a, _Node) or not isinstance(b, _Node):
+        # At least one side is a leaf or a collision: fold its leaves into
+        # the other side one at a time.
+        if isinstance(a, _Node):
+            node, small, small_first = a, b, False
+        else:
+            node, small, small_first = b, a, True
+        for leaf in _leaves(small):
+            old = _get(node, leaf.hash, leaf.key, shift, _EMPTY)
+            if old is not _EMPTY:
+                value = combine(leaf.value, old) if small_first else combine(old, leaf.value)
+                if _same(value, old):
+                    continue
+                leaf = _Leaf(leaf.hash, leaf.key, value)
+            node = _set(node, leaf, shift)
+        return node
+
+    bitmap = a.bitmap | b.bitmap
+    entries = []
+    ia = ib = 0
+    bits = bitmap
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        if a.bitmap & bit and b.bitmap & bit:
+            entries.append(_merge(a.entries[ia], b.entries[ib], combine, shift + _BITS))
+            ia += 1
+            ib += 1
+        elif a.bitmap & bit:
+            entries.append(a.entries[ia])
+            ia += 1
+        else:
+            entries.append(b.entries[ib])
+            ib += 1
+
+    entries = tuple(entries)
+    for side in (a, b):
+        if side.bitmap == bitmap and all(x is y for x, y in zip(side.entries, entries)):
+            return side
+    return _Node(bitmap, entries)
+
+
+def _equal(a, b):
+    if a is b:
+        return True
+    if isinstance(a, _Node) and isinstance(b, _Node):
+        return a.bitmap == b.bitmap and all(
+            _equal(x, y) for x, y in zip(a.entries, b.entries)
+        )
+    if isinstance(a, _Leaf) and isinstance(b, _Leaf):
+        return a.key == b.key and a.value == b.value
+    if isinstance(a, _Collision) and isinstance(b, _Collision):
+        return len(a.leaves) == len(b.leaves) and all(
+            _get(b, leaf.hash, leaf.key, _HASH_BITS, _EMPTY) == leaf.value
+            for leaf in a.leaves
+        )
+    return False
+
+
+class PMap:
+    """An immutable mapping with cheap, structure-sharing updates."""
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, items=()):
+        self._root = _EMPTY
+        self._len = None
+        if items:
+            pairs = items.items() if hasattr(items, "items") else items
+            for key, value in pairs:
+                self._root = _set(self._root, _Leaf(_hash(key), key, value), 0)
+
+    @classmethod
+    def _wrap(cls, root):
+        out = cls.__new__(cls)
+        out._root = root
+        out._len = None
+        return out
+
+    def set(self, key, value):
+        """A map with `key` bound to `value`. Returns this same map if the
+        key already had that value.
+        """
+        root = _set(self._root, _Leaf(_hash(key), key, value), 0)
+        return self if root is self._root else PMap._wrap(root)
+
+    def merge(self, other, combine):
+        """A map with the keys of both maps, where keys in both get
+        `combine(mine, theirs)`. Shared subtrees are not visited.
+        """
+        root = _merge(self._root, other._root, combine, 0)
+        if root is self._root:
+            return self
+        if root is other._root:
+            return other
+        return PMap._wrap(root)
+
+    def get(self, key, default=None):
+        return _get(self._root, _hash(key), key, 0, default)
+
+    def __getitem__(self, key):
+        value = _get(self._root, _hash(key), key, 0, _EMPTY)
+        if value is _EMPTY:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return _get(self._root, _hash(key), key, 0, _EMPTY) is not _EMPTY
+
+    def items(self):
+        return ((leaf.key, leaf.value) for leaf in _leaves(self._root))
+
+    def keys(self):
+        return (leaf.key for leaf in _leaves(self._root))
+
+    def __iter__(self):
+        return self.keys()
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in _leaves(self._root))
+        return self._len
+
+    def __bool__(self):
+        return self._root is not _EMPTY
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, PMap):
+            return _equal(self._root, other._root)
+        if isinstance(other, dict):
+            return len(self) == len(other) and all(
+                k in other and other[k] == v for k, v in self.items()
+            )
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "PMap({})".format(dict(self.items()))
+
+
+def footprint(values):
+    """Approximate the bytes held by a collection of lattice values,
+    counting every shared object once. Works for `PMap`s as well as
+    plain dicts and sets, so the two representations can be compared.
+    """
+    seen = set()
+    total = 0
+    stack = list(values)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, PMap):
+            stack.append(obj._root)
+        elif isinstance(obj, _Node):
+            stack.append(obj.entries)
+            stack.extend(obj.entries)
+        elif isinstance(obj, _Collision):
+            stack.append(obj.leaves)
+            stack.extend(obj.leaves)
+    return total
@@ -0,0 +1,150 @@
+"""An on-disk, content-addressed cache of tool output.
+
+A result is stored under the SHA-256 of what produced it: the tool, the
+analysis or options, and the canonical JSON of the instructions it ran
+on (sorted keys, no whitespace). The same function run through the same
+analysis again, by any later process, is then answered from disk
+without forming blocks or running the analysis.
+
+Each entry is one file, `<dir>/<first two hex digits>/<key>`, written
+to a temporary name and renamed into place, so concurrent runs never
+see a partial entry. A file's modification time is its last use: hits
+touch it, and when the cache grows past its size limit the least
+recently used entries are deleted first, along with any temporary
+files a crashed run left behind.
+
+`working_with_cfgs` uses this file through a symlink to it, so each
+directory still runs on its own with one copy to edit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# Bump this when a tool's output format changes, to orphan old entries.
+VERSION = 1
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+# How old (in seconds) a temporary file must be before `evict` takes it
+# for a crashed run's leftover rather than a write still in progress.
+STALE_TMP = 60 * 60
+
+
+def canonical(data):
+    """The canonical JSON text of `data`, for hashing."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+class ResultCache:
+    """A directory of cached results, holding at most `limit` bytes."""
+
+    def __init__(self, path, limit=DEFAULT_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        # The total size of the entries, counted on the first `put` and
+        # kept up to date from then on.
+        self.size = None
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, tool, analysis, data):
+        """The key of running `analysis` of `tool` on `data` (usually a
+        function's instructions, as JSON data).
+        """
+        digest = hashlib.sha256()
+        digest.update(canonical([VERSION, tool, analysis]).encode())
+        digest.update(canonical(data).encode())
+        return digest.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """The text stored under `key`, or None."""
+        path = self._file(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another run in the meantime; the text is fine.
+            pass
+        self.hits += 1
+        return text
+
+    def put(self, key, text):
+        """Store `text` under `key`, then evict down to the size limit."""
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.size is None:
+            self.evict()
+        else:
+            self.size += os.path.getsize(path) - replaced
+            if self.size > self.limit:
+                self.evict()
+
+    def _scan(self):
+        """(last use, size, path) of every entry, and of every temporary
+        file.
+        """
+        entries, tmps = [], []
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found = tmps if entry.name.startswith(".tmp") else entries
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries, tmps
+
+    def entries(self):
+        """(last use, size, path) of every entry."""
+        return self._scan()[0]
+
+    def evict(self):
+        """Delete stale temporary files, then the least recently used
+        entries until the cache fits in its limit.
+        """
+        entries, tmps = self._scan()
+        stale = time.time() - STALE_TMP
+        for mtime, _, path in tmps:
+            if mtime < stale:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        total = sum(size for _, size, _ in entries)
+        if total > self.limit:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.limit:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self.size = total
@@ -0,0 +1,243 @@
+"""Sparse conditional constant propagation.
+
+This is Wegman and Zadeck's algorithm, run over def-use chains instead
+of SSA form: every instruction with a `dest` is a definition site, and
+each use is linked to the definition sites that reach it. Two worklists
+drive the propagation. The flow worklist holds CFG edges that have just
+become executable, and the def-use worklist holds definition sites whose
+value just changed. Only instructions in executable blocks are ever
+evaluated, so branches on constants prune the code they skip.
+
+Without SSA, a definition that reaches a join along an edge that never
+executes still takes part in the meet there (as long as its own block
+runs), so this can be less precise than SCCP over SSA form.
+"""
+
+import bitvec
+from compact_cfg import CompactCFG
+from df import Analysis, df_worklist
+
+# The lattice is TOP (no value seen yet), then constants, then BOTTOM
+# ("?", not a constant).
+TOP = object()
+BOTTOM = "?"
+
+# Undefined variables are read from this pseudo-site.
+UNKNOWN = -1
+
+
+def _wrap(value):
+    """Wrap an integer to Bril's 64-bit two's complement range."""
+    return (value + 2**63) % 2**64 - 2**63
+
+
+def _div(a, b):
+    if b == 0:
+        return BOTTOM
+    quotient = abs(a) // abs(b)
+    return _wrap(quotient if (a < 0) == (b < 0) else -quotient)
+
+
+FOLDERS = {
+    "add": lambda a, b: _wrap(a + b),
+    "sub": lambda a, b: _wrap(a - b),
+    "mul": lambda a, b: _wrap(a * b),
+    "div": _div,
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "gt": lambda a, b: a > b,
+    "le": lambda a, b: a <= b,
+    "ge": lambda a, b: a >= b,
+    "not": lambda a: not a,
+    "and": lambda a, b: a and b,
+    "or": lambda a, b: a or b,
+    "id": lambda a: a,
+}
+
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP:
+        return a
+    if a == b and type(a) is type(b):
+        return a
+    return BOTTOM
+
+
+def def_sites(blocks, args=()):
+    """Number every definition in the block map. Returns a list of
+    (block, index, variable) sites and a map from each variable to the
+    bit vector of its sites. Function arguments come first, as sites at
+    index -1 of the entry block.
+    """
+    sites = []
+    var_sites = {}
+    entry = next(iter(blocks))
+    for var in args:
+        var_sites[var] = var_sites.get(var, 0) | (1 << len(sites))
+        sites.append((entry, -1, var))
+    for name, block in blocks.items():
+        for i, instr in enumerate(block):
+            if "dest" in instr:
+                var_sites[instr["dest"]] = var_sites.get(instr["dest"], 0) | (
+                    1 << len(sites)
+                )
+                sites.append((name, i, instr["dest"]))
+    return sites, var_sites
+
+
+def reaching_sites(blocks, sites, var_sites, graph):
+    """Which definition sites reach the start and end of each block, as
+    bit vectors, using the ordinary gen/kill worklist.
+    """
+    summaries = {name: (0, 0) for name in blocks}
+    for site, (name, _, var) in enumerate(sites):
+        gen, kill = summaries[name]
+        # A later definition in the same block replaces an earlier one.
+        summaries[name] = (gen & ~var_sites[var] | (1 << site), kill | var_sites[var])
+    reach = Analysis(True, init=0, merge=bitvec.union, transfer=bitvec.transfer)
+    reach_in, reach_out = df_worklist(blocks, reach, summaries, graph=graph)
+
+    # The arguments are defined just before the entry block runs.
+    for site, (name, i, _) in enumerate(sites):
+        if i == -1:
+            reach_in[name] |= 1 << site
+    return reach_in, reach_out
+
+
+def def_use_chains(blocks, sites, var_sites, reach_in):
+    """Link every use to the definition sites that reach it.
+
+    Returns `uses`, mapping (block, index) to a list of (variable,
+    sites) pairs for the instruction's arguments, and `users`, mapping
+    each site to the (block, index) pairs that read it. Variables with
+    no reaching definition read the `UNKNOWN` site.
+    """
+    uses = {}
+    users = [[] for _ in sites]
+    site_ids = {(name, i): site for site, (name, i, _) in enumerate(sites)}
+    for name, block in blocks.items():
+        live = reach_in[name]
+        for i, instr in enumerate(block):
+            args = []
+            for var in instr.get("args", []):
+                bits = live & var_sites.get(var, 0)
+                reaching = []
+                while bits:
+                    low = bits & -bits
+                    site = low.bit_length() - 1
+                    reaching.append(site)
+                    users[site].append((name, i))
+                    bits ^= low
+                args.append((var, reaching or [UNKNOWN]))
+            uses[(name, i)] = args
+            if "dest" in instr:
+                live = live & ~var_sites[instr["dest"]] | (1 << site_ids[(name, i)])
+    return uses, users
+
+
+def sccp(blocks, args=()):
+    """Run sparse conditional constant propagation over a block map with
+    terminators, for a function with the given `args` (as in the JSON).
+
+    Returns (in, out) maps from block names to dicts of the variables
+    with a known value at the start and end of the block, like `cprop`:
+    a constant, or "?" if the variable is not constant. Blocks that can
+    never execute map to empty dicts.
+    """
+    graph = CompactCFG.from_block_map(blocks)
+    if not len(graph):
+        return {}, {}
+    args = [arg["name"] for arg in args]
+    sites, var_sites = def_sites(blocks, args)
+    reach_in, reach_out = reaching_sites(blocks, sites, var_sites, graph)
+    uses, users = def_use_chains(blocks, sites, var_sites, reach_in)
+    site_ids = {(name, i): site for site, (name, i, _) in enumerate(sites)}
+
+    values = [BOTTOM if i == -1 else TOP for _, i, _ in sites]
+    executable = bytearray(len(graph))
+    seen_edges = set()
+    flow = [(-1, 0)]
+    def_use = []
+
+    def arg_value(reaching):
+        value = TOP
+        for site in reaching:
+            value = meet(value, BOTTOM if site == UNKNOWN else values[site])
+        return value
+
+    def evaluate(name, i):
+        """Evaluate one instruction of an executable block."""
+        instr = blocks[name][i]
+        operands = [arg_value(reaching) for _, reaching in uses[(name, i)]]
+        op = instr["op"]
+
+        if op in ("jmp", "br"):
+            targets = instr["labels"]
+            if op == "br":
+                if operands[0] is TOP:
+                    return
+                if operands[0] is not BOTTOM:
+                    targets = targets[:1] if operands[0] else targets[1:]
+            source = graph.ids[name]
+            flow.extend((source, graph.ids[target]) for target in targets)
+            return
+        if "dest" not in instr:
+            return
+
+        if op == "const":
+            value = instr["value"]
+        elif op in FOLDERS and operands and all(v is not TOP for v in operands):
+            if any(v is BOTTOM for v in operands):
+                value = BOTTOM
+            else:
+                value = FOLDERS[op](*operands)
+        elif op in FOLDERS and operands:
+            return
+        else:
+            value = BOTTOM
+
+        site = site_ids[(name, i)]
+        value = meet(values[site], value)
+        if values[site] is TOP or value != values[site]:
+            values[site] = value
+            def_use.append(site)
+
+    while flow or def_use:
+        while flow:
+            edge = flow.pop()
+            if edge in seen_edges:
+                continue
+            seen_edges.add(edge)
+            node = edge[1]
+            if not executable[node]:
+                executable[node] = 1
+                name = graph.labels[node]
+                for i in range(len(blocks[name])):
+                    evaluate(name, i)
+        while def_use:
+            site = def_use.pop()
+            for name, i in users[site]:
+                if executable[graph.ids[name]]:
+                    evaluate(name, i)
+
+    def block_values(bits):
+        out = {}
+        while bits:
+            low = bits & -bits
+            _, _, var = sites[low.bit_length() - 1]
+            out[var] = meet(out.get(var, TOP), values[low.bit_length() - 1])
+            bits ^= low
+        return {var: value for var, value in out.items() if value is not TOP}
+
+    in_ = {}
+    out = {}
+    for node, name in enumerate(graph.labels):
+        if executable[node]:
+            in_[name] = block_values(reach_in[name])
+            out[name] = block_values(reach_out[name])
+        else:
+            in_[name] = {}
+            out[name] = {}
+    return in_, out
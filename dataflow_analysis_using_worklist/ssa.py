@@ -0,0 +1,233 @@
+"""Convert functions to SSA form and back.
+
+Phi nodes are placed on the iterated dominance frontiers of each
+variable's definitions, but only where the variable is live, using the
+`live` analysis from `df.py` (so this is pruned SSA). Variables are then
+renamed in a walk over the dominator tree. A phi looks like this, with
+one argument per predecessor:
+
+    {"op": "phi", "dest": "x.2", "type": "int",
+     "args": ["x.1", "x.3"], "labels": ["entry", "loop"]}
+
+A phi argument is "__undefined" when the variable has no definition
+along that edge.
+
+Leaving SSA replaces each phi with `id` copies at the end of its
+predecessors. That is only correct for SSA as built here, before any
+optimization has moved copies around. An undefined argument becomes a
+zero constant (for types that have one), so a later copy out of the
+phi's variable never reads an undefined variable.
+
+    bril2json < prog.bril | python3 ssa.py | bril2txt
+"""
+
+import json
+import sys
+import argparse
+
+import cfg
+from compact_cfg import CompactCFG
+from df import REACH_DEFINITIONS, df_worklist, prepare
+from util import Names
+
+UNDEFINED = "__undefined"
+
+# Stand-ins for undefined phi arguments when leaving SSA.
+ZEROS = {"int": 0, "bool": False, "float": 0.0}
+
+
+def dominance_frontiers(graph, idoms):
+    """The dominance frontier of every block, as a list of sets of block
+    IDs, by Cooper, Harvey and Kennedy's method: walk up the dominator
+    tree from each predecessor of a join point until reaching the join
+    point's immediate dominator.
+    """
+    frontiers = [set() for _ in range(len(graph))]
+    for node in range(len(graph)):
+        preds = graph.predecessors(node)
+        if len(preds) < 2 or idoms[node] == -1:
+            continue
+        for pred in preds:
+            if idoms[pred] == -1:
+                continue
+            runner = pred
+            while runner != idoms[node]:
+                frontiers[runner].add(node)
+                runner = idoms[runner]
+    return frontiers
+
+
+def live_in(blocks):
+    """The variables live at the start of every block."""
+    analysis, summaries, universe = prepare(blocks, REACH_DEFINITIONS["live"])
+    in_, _ = df_worklist(blocks, analysis, summaries)
+    return {name: universe.decode(bits) for name, bits in in_.items()}
+
+
+def to_ssa(blocks, args=()):
+    """Rewrite a block map into SSA form, in place.
+
+    The blocks must have terminators, and the entry block must have no
+    predecessors (see `cfg.add_terminators` and `cfg.add_entry`). `args`
+    are the function's arguments, as in the JSON; they keep their names
+    as the first version of each argument. Unreachable blocks get no
+    phis, but their definitions are still renamed.
+    """
+    graph = CompactCFG.from_block_map(blocks)
+    if not len(graph):
+        return blocks
+    idoms = graph.immediate_dominators()
+    frontiers = dominance_frontiers(graph, idoms)
+    live = live_in(blocks)
+
+    # Where each variable is defined, and its type.
+    types = {arg["name"]: arg["type"] for arg in args}
+    defs = {}
+    for node, name in enumerate(graph.labels):
+        for instr in blocks[name]:
+            if "dest" in instr:
+                defs.setdefault(instr["dest"], set()).add(node)
+                types.setdefault(instr["dest"], instr.get("type"))
+
+    # Place phis on the iterated dominance frontiers, where live.
+    phis = [{} for _ in range(len(graph))]
+    for var, def_nodes in defs.items():
+        worklist = list(def_nodes)
+        while worklist:
+            node = worklist.pop()
+            for frontier in frontiers[node]:
+                if var in phis[frontier]:
+                    continue
+                if var not in live[graph.labels[frontier]]:
+                    continue
+                phis[frontier][var] = {
+                    "op": "phi",
+                    "dest": var,
+                    "type": types[var],
+                    "args": [],
+                    "labels": [],
+                }
+                if frontier not in def_nodes:
+                    worklist.append(frontier)
+
+    # Rename, walking the dominator tree with a stack of versions per
+    # variable.
+    children = [[] for _ in range(len(graph))]
+    for node, idom in enumerate(idoms):
+        if idom != -1 and idom != node:
+            children[idom].append(node)
+    names = Names(
+        var
+        for block in blocks.values()
+        for instr in block
+        for var in [instr.get("dest"), *instr.get("args", [])]
+        if var is not None
+    )
+    stacks = {arg["name"]: [arg["name"]] for arg in args}
+
+    def rename(node):
+        pushed = []
+        for var, phi in phis[node].items():
+            phi["dest"] = names.fresh(var + ".")
+            stacks.setdefault(var, []).append(phi["dest"])
+            pushed.append(var)
+        for instr in blocks[graph.labels[node]]:
+            if "args" in instr:
+                instr["args"] = [
+                    stacks[arg][-1] if stacks.get(arg) else arg for arg in instr["args"]
+                ]
+            if "dest" in instr:
+                var = instr["dest"]
+                instr["dest"] = names.fresh(var + ".")
+                stacks.setdefault(var, []).append(instr["dest"])
+                pushed.append(var)
+        label = graph.labels[node]
+        for succ in dict.fromkeys(graph.successors(node)):
+            for var, phi in phis[succ].items():
+                phi["args"].append(stacks[var][-1] if stacks.get(var) else UNDEFINED)
+                phi["labels"].append(label)
+        return pushed
+
+    # Unreachable blocks are roots of their own, after the real tree.
+    roots = [node for node in range(len(graph)) if idoms[node] == -1]
+    stack = [(node, None) for node in reversed(roots)] + [(0, None)]
+    while stack:
+        node, pushed = stack.pop()
+        if pushed is not None:
+            # Leaving the subtree: drop the versions this block pushed.
+            for var in pushed:
+                stacks[var].pop()
+            continue
+        stack.append((node, rename(node)))
+        stack.extend((child, None) for child in reversed(children[node]))
+
+    for node, name in enumerate(graph.labels):
+        if phis[node]:
+            blocks[name][:0] = phis[node].values()
+    return blocks
+
+
+def from_ssa(blocks):
+    """Take a block map out of SSA form, in place, by replacing each phi
+    with a copy at the end of each of its predecessors.
+    """
+    copies = {}
+    for name, block in blocks.items():
+        for instr in block:
+            if instr.get("op") != "phi":
+                continue
+            for arg, label in zip(instr["args"], instr["labels"]):
+                copy = {"dest": instr["dest"], "type": instr["type"]}
+                if arg != UNDEFINED:
+                    copy.update(op="id", args=[arg])
+                elif instr["type"] in ZEROS:
+                    copy.update(op="const", value=ZEROS[instr["type"]])
+                else:
+                    continue
+                copies.setdefault(label, []).append(copy)
+        block[:] = [instr for instr in block if instr.get("op") != "phi"]
+    for label, instrs in copies.items():
+        # Copies go just before the terminator.
+        blocks[label][-1:-1] = instrs
+    return blocks
+
+
+def func_to_ssa(func):
+    """Convert one function (as JSON) to SSA form, in place."""
+    names = Names()
+    blocks, _, _ = cfg.build_cfg(func.get("instrs", []), names)
+    if blocks:
+        cfg.add_entry(blocks, names)
+        cfg.add_terminators(blocks)
+    to_ssa(blocks, func.get("args", []))
+    func["instrs"] = cfg.reassemble(blocks)
+    return func
+
+
+def func_from_ssa(func):
+    """Take one function (as JSON) out of SSA form, in place."""
+    blocks, _, _ = cfg.build_cfg(func.get("instrs", []))
+    from_ssa(blocks)
+    func["instrs"] = cfg.reassemble(blocks)
+    return func
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert bril JSON input to SSA form, printing JSON"
+    )
+    parser.add_argument(
+        "-r",
+        "--roundtrip",
+        action="store_true",
+        help="Go back out of SSA form afterwards.",
+    )
+    args = parser.parse_args()
+
+    bril = json.load(sys.stdin)
+    for func in bril["functions"]:
+        func_to_ssa(func)
+        if args.roundtrip:
+            func_from_ssa(func)
+    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+    print()
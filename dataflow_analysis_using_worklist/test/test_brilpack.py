@@ -0,0 +1,78 @@
+"""Check that `brilpack` round-trips the test programs, and that what it
+unpacks can be edited without the edit showing up anywhere else.
+
+Run with `python3 -m unittest` (or pytest) from this directory.
+"""
+
+import glob
+import io
+import json
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import briltxt
+import brilpack
+
+
+def pack(bril):
+    f = io.BytesIO()
+    brilpack.dump(bril, f)
+    return brilpack.loads(f.getvalue())
+
+
+def plain(bril):
+    """A packed program's JSON data, with every function unpacked."""
+    return dict(bril, functions=list(bril["functions"]))
+
+
+class BrilpackTest(unittest.TestCase):
+    def test_roundtrip(self):
+        for path in sorted(glob.glob(os.path.join(HERE, "*.bril"))):
+            with open(path) as f:
+                bril = json.loads(briltxt.parse_bril(f.read(), include_pos=True))
+            with self.subTest(program=os.path.basename(path)):
+                self.assertEqual(plain(pack(bril)), bril)
+
+    def test_fresh_values(self):
+        ptr = {"ptr": "int"}
+        pos = {"row": 1, "col": 2}
+        instr = {"op": "alloc", "dest": "p", "type": ptr, "args": ["n"], "pos": pos}
+        func = {
+            "name": "f",
+            "args": [{"name": "q", "type": ptr}],
+            "type": ptr,
+            "instrs": [instr, instr],
+            "pos": pos,
+        }
+        bril = pack(json.loads(json.dumps({"functions": [func, func]})))
+        first, second = bril["functions"]
+        first["type"]["ptr"] = "bool"
+        first["args"][0]["type"]["ptr"] = "bool"
+        first["pos"]["row"] = 0
+        first["instrs"][0]["type"]["ptr"] = "bool"
+        first["instrs"][0]["pos"]["col"] = 0
+        self.assertEqual(first["instrs"][1], instr)
+        self.assertEqual(second, func)
+
+    def test_lookup_by_name(self):
+        funcs = [
+            {"name": name, "instrs": [{"op": "ret"}]} for name in ("main", "f", "g")
+        ]
+        bril = pack({"functions": funcs})
+        by_name = brilpack.functions_by_name(bril)
+        self.assertEqual(list(by_name), ["main", "f", "g"])
+        packed = bril["functions"].packed
+        self.assertEqual(packed.funcs, [None, None, None])
+        self.assertEqual(by_name["f"], funcs[1])
+        self.assertEqual(packed.funcs[0::2], [None, None])
+        self.assertEqual(
+            brilpack.functions_by_name({"functions": funcs})["g"], funcs[2]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Check that the per-instruction facts of `df.InstrFacts` agree with the
+block-level solution: for every analysis, the point before a block's
+first instruction holds its in facts and the point after its last
+instruction holds its out facts.
+
+Run with `python3 -m unittest` (or pytest) from this directory.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import briltxt
+import df
+
+
+def load(path):
+    with open(path) as f:
+        return json.loads(briltxt.parse_bril(f.read()))
+
+
+def block_transfer(analysis, instrs, i, facts, block):
+    """The fact at point `i` of a block, from the block transfer function
+    over the instructions before it (after it, for backward analyses).
+    """
+    if analysis.forward:
+        start, instrs = facts.get(block, 0), instrs[:i]
+    else:
+        start, instrs = facts.get(block, len(instrs)), instrs[i:]
+    return analysis.transfer(instrs, start)
+
+
+class InstrFactsTest(unittest.TestCase):
+    def check(self, bril, bits):
+        for name, analysis in df.REACH_DEFINITIONS.items():
+            for func in bril["functions"]:
+                blocks, facts = df.instr_facts(func, analysis, bits)
+                for block, instrs in blocks.items():
+                    # A point on its own, before the block is expanded.
+                    middle = len(instrs) // 2
+                    alone = facts.get(block, middle)
+                    points = facts.block_points(block)
+                    self.assertEqual(len(points), len(instrs) + 1)
+                    self.assertEqual(points[0], facts.in_[block], (name, block))
+                    self.assertEqual(points[-1], facts.out[block], (name, block))
+                    self.assertEqual(alone, facts.get(block, middle))
+                    for i in range(len(instrs) + 1):
+                        self.assertEqual(
+                            facts.get(block, i),
+                            block_transfer(analysis, instrs, i, facts, block),
+                            (name, block, i),
+                        )
+
+    def test_programs(self):
+        for path in sorted(glob.glob(os.path.join(HERE, "*.bril"))):
+            bril = load(path)
+            for bits in (True, False):
+                with self.subTest(program=os.path.basename(path), bits=bits):
+                    self.check(bril, bits)
+
+    def test_available_redefined_operand(self):
+        # Redefining `a` kills `add a b` computed before it.
+        bril = load(os.path.join(HERE, "avail_redefine.bril"))
+        blocks, facts = df.instr_facts(
+            bril["functions"][0], df.REACH_DEFINITIONS["available"]
+        )
+        (block,) = blocks
+        self.assertNotIn(("add", "a", "b"), facts.get(block, 4))
+        self.assertIn(("add", "a", "b"), facts.get(block, 3))
+        self.assertIn(("add", "a", "b"), facts.get(block, 6))
+
+    def test_linear(self):
+        # One long block: expanding it must not redo the block transfer
+        # at every point.
+        instrs = [{"op": "const", "dest": "a", "type": "int", "value": 1}]
+        for i in range(4000):
+            instrs.append(
+                {"op": "add", "dest": f"v{i % 50}", "type": "int", "args": ["a", "a"]}
+            )
+        func = {"name": "main", "instrs": instrs}
+        for name, analysis in df.REACH_DEFINITIONS.items():
+            for bits in (True, False):
+                blocks, facts = df.instr_facts(func, analysis, bits)
+                (block,) = blocks
+                start = time.perf_counter()
+                facts.block_points(block)
+                self.assertLess(time.perf_counter() - start, 1.0, (name, bits))
+
+
+if __name__ == "__main__":
+    unittest.main()
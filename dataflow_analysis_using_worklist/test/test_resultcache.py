@@ -0,0 +1,110 @@
+"""Tests of `resultcache.ResultCache`, and of `df.run_df` through it: a
+warm run must print exactly what a cold (or uncached) run prints, and
+eviction must go in least recently used order.
+
+Run with `python3 -m unittest` (or pytest) from this directory.
+"""
+
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import briltxt
+import df
+import resultcache
+from resultcache import ResultCache
+
+
+def load(path):
+    with open(path) as f:
+        return json.loads(briltxt.parse_bril(f.read()))
+
+
+def run(bril, analysis, cache=None, jobs=1):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        df.run_df(bril, analysis, jobs=jobs, cache=cache)
+    return out.getvalue()
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def age(self, cache, key, mtime):
+        os.utime(cache._file(key), (mtime, mtime))
+
+    def test_cold_warm(self):
+        programs = sorted(glob.glob(os.path.join(HERE, "*.bril")))
+        for analysis in sorted(df.REACH_DEFINITIONS):
+            cache = ResultCache(self.dir)
+            for path in programs:
+                with self.subTest(analysis=analysis, program=path):
+                    bril = load(path)
+                    expected = run(bril, analysis)
+                    hits = cache.hits
+                    self.assertEqual(run(bril, analysis, cache), expected)
+                    self.assertEqual(cache.hits, hits)
+                    # A new cache over the same directory, as a later
+                    # process would open.
+                    warm = ResultCache(self.dir)
+                    self.assertEqual(run(bril, analysis, warm), expected)
+                    self.assertEqual(warm.hits, len(bril["functions"]))
+                    self.assertEqual(warm.misses, 0)
+
+    def test_lru_order(self):
+        cache = ResultCache(self.dir, limit=300)
+        keys = [cache.key("test", n, []) for n in range(3)]
+        for n, key in enumerate(keys):
+            cache.put(key, "x" * 100)
+            self.age(cache, key, 1000 + n)
+        # Using the oldest entry makes the next one the least recent.
+        self.assertEqual(cache.get(keys[0]), "x" * 100)
+        extra = cache.key("test", 3, [])
+        cache.put(extra, "x" * 100)
+        self.assertIsNone(cache.get(keys[1]))
+        for key in (keys[0], keys[2], extra):
+            self.assertEqual(cache.get(key), "x" * 100)
+        self.assertEqual(cache.size, 300)
+
+    def test_overwrite_size(self):
+        cache = ResultCache(self.dir, limit=1000)
+        first, second = cache.key("test", 1, []), cache.key("test", 2, [])
+        cache.put(first, "x" * 100)
+        cache.put(second, "x" * 100)
+        for _ in range(5):
+            cache.put(first, "y" * 100)
+        self.assertEqual(cache.size, 200)
+        self.assertEqual(cache.get(second), "x" * 100)
+
+    def test_stale_tmp(self):
+        cache = ResultCache(self.dir)
+        key = cache.key("test", 1, [])
+        cache.put(key, "x")
+        shard = os.path.dirname(cache._file(key))
+        stale = os.path.join(shard, ".tmpstale")
+        fresh = os.path.join(shard, ".tmpfresh")
+        for path in (stale, fresh):
+            with open(path, "w") as f:
+                f.write("partial")
+        old = os.path.getmtime(stale) - resultcache.STALE_TMP - 1
+        os.utime(stale, (old, old))
+        cache.evict()
+        self.assertFalse(os.path.exists(stale))
+        # It may still be written by another run.
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(cache.size, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,3 +14,31 @@ def fresh(seed, names):
         if name not in names:
             return name
         i += 1
+
+
+class Names:
+    """Hand out fresh names, like `fresh`, without rescanning.
+
+    Every name that is already taken has to be reserved, either up front
+    or with `reserve`. Each seed remembers where its numbering left off,
+    so a run of allocations with the same seed takes linear time in
+    total. Share one of these between the passes that add blocks to the
+    same function to keep all their names distinct.
+    """
+
+    def __init__(self, reserved=()):
+        self.reserved = set(reserved)
+        self.counters = {}
+
+    def reserve(self, name):
+        self.reserved.add(name)
+
+    def fresh(self, seed):
+        """Generate and reserve a new name starting with `seed`."""
+        i = self.counters.get(seed, 1)
+        while seed + str(i) in self.reserved:
+            i += 1
+        self.counters[seed] = i + 1
+        name = seed + str(i)
+        self.reserved.add(name)
+        return name
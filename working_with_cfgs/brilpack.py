@@ -0,0 +1 @@
+../dataflow_analysis_using_worklist/brilpack.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dataflow_analysis_using_worklist/compact_cfg.py
\ No newline at end of file
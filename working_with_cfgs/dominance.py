@@ -0,0 +1 @@
+../dataflow_analysis_using_worklist/dominance.py
\ No newline at end of file
@@ -1,9 +1,25 @@
+import contextlib
+import io
 import json
 import sys
 import argparse
 from collections import deque
 from collections.abc import Iterator
 
+import briltxt
+from brilpack import functions_by_name, load_bril
+from compact_cfg import CompactCFG
+from dominance import (
+    DepthFirstSearch,
+    depth_first_search,
+    dominates,
+    dominator_intervals,
+    find_immediate_dominators,
+    reverse_postorder,
+)
+from loops import LoopForest, find_loops
+from resultcache import ResultCache
+
 # cfg generation program
 
 
@@ -124,11 +140,52 @@ def get_cfg(block_map, debug=False) -> dict:
     return the_cfg
 
 
-def gen_dot(cfg, debug=False) -> str:
-    dot_script = "digraph {\n"
+def dot_label(name, block) -> str:
+    """
+    desc: build a left justified DOT label listing a block's instructions
+
+    param: name(str)    = block name
+    param: block(list)  = instructions in the block
+
+    returns: escaped label text
+    """
+    lines = [f"{name}:"]
+    lines += [f"  {briltxt.instr_to_string(inst)}" for inst in block if "op" in inst]
+    return "".join(
+        line.replace("\\", "\\\\").replace('"', '\\"') + "\\l" for line in lines
+    )
+
+
+def write_dot(cfg, out, block_map=None, cluster=None, debug=False) -> None:
+    """
+    desc: write the DOT script for a CFG straight to a file-like object,
+          one line per node and edge
+
+    param: cfg(dict)       = mapping{node: [successors]}
+    param: out(file)       = where to write the script
+    param: block_map(dict) = mapping{node: block}, to label nodes with
+                             their instructions
+    param: cluster(str)    = function name, to write a `subgraph cluster`
+                             for that function instead of a digraph
+    """
+    if cluster is None:
+        prefix = ""
+        out.write("digraph {\n")
+    else:
+        # node names need to be unique across the whole program
+        prefix = f"{cluster}."
+        out.write(f'subgraph "cluster_{cluster}" {{\n')
+        out.write(f'     label="@{cluster}";\n')
+
     # define nodes based on cfg
     for name in cfg.keys():
-        dot_script += f'     "{name}";\n'
+        if block_map is not None:
+            label = dot_label(name, block_map[name])
+            out.write(f'     "{prefix}{name}" [shape=box, label="{label}"];\n')
+        elif cluster is not None:
+            out.write(f'     "{prefix}{name}" [label="{name}"];\n')
+        else:
+            out.write(f'     "{name}";\n')
 
     # define edges based on cfg
     for name, successors in cfg.items():
@@ -139,10 +196,31 @@ def gen_dot(cfg, debug=False) -> str:
         for successor in successors:
             if debug:
                 print(f"\nSuccessor in successors:\n{successor}\n")
-            dot_script += f'     "{name}" -> "{successor}";\n'
+            out.write(f'     "{prefix}{name}" -> "{prefix}{successor}";\n')
+
+    out.write("}\n")
+
 
-    dot_script += "}\n"
-    return dot_script
+def write_call_edges(out, calls, entries) -> None:
+    """
+    desc: write call sites as dashed edges to the callee's entry block
+
+    param: calls(list)    = call sites (caller, block, callee)
+    param: entries(dict)  = mapping{function name: entry block or None}
+    """
+    for caller, block, callee in calls:
+        # calls to functions outside the program have nowhere to go
+        entry = entries.get(callee)
+        if entry is not None:
+            out.write(
+                f'     "{caller}.{block}" -> "{callee}.{entry}" [style=dashed];\n'
+            )
+
+
+def gen_dot(cfg, debug=False) -> str:
+    dot_script = io.StringIO()
+    write_dot(cfg, dot_script, debug=debug)
+    return dot_script.getvalue()
 
 
 # working with cfgs
@@ -153,12 +231,21 @@ def get_path_length(cfg, entry, debug=False) -> tuple[dict, dict]:
     desc: computes shortest path length (in edges)
           from entry node to each node in CFG BFS
 
-    param: cfg(dict)  = mapping{node: [successors]}
+    param: cfg(dict)  = mapping{node: [successors]}, or a CompactCFG
     param: entry(str) = starting node
 
     returns: dict {node:distance from entry}
     """
 
+    if isinstance(cfg, CompactCFG):
+        dist, parent = cfg.path_lengths(cfg.ids[entry])
+        dist_map = dict(zip(cfg.labels, dist))
+        preds = {
+            label: cfg.labels[p] if p != -1 else None
+            for label, p in zip(cfg.labels, parent)
+        }
+        return dist_map, preds
+
     dist_map = {i: -1 for i in cfg}
     preds = {i: None for i in cfg}
     dist_map[entry] = 0
@@ -186,140 +273,347 @@ def get_path_length(cfg, entry, debug=False) -> tuple[dict, dict]:
     return dist_map, preds
 
 
-def reverse_postorder(cfg, entry, debug=False) -> list[str]:
+def find_back_edges(cfg, entry, debug=False) -> list[str]:
     """
-    desc: compute RPO for a CFG
+    desc: find back edges of a CFG using DFS
 
     param: cfg(dict)  = mapping{node: [successors]}
     param: entry(str) = starting node
 
-    returns: list[nodes in reverse post order]
+    returns: list of edges(u,v) where u -> v is a back edge
     """
+    return depth_first_search(cfg, entry, debug).back_edges
 
-    visited = set()
-    po_list = []
 
-    def depth_first_search_helper(a_node):
-        if a_node not in visited:
-            visited.add(a_node)
-            for successor in cfg.get(a_node, []):
-                depth_first_search_helper(successor)
-            po_list.append(a_node)
-        if debug:
-            print(f"The node:\n{a_node}\n\nThe po list:\n{po_list}\n")
+def is_reduceable(cfg, entry, debug=False, dfs=None, idoms=None) -> bool:
+    """
+    desc: determine whether a cfg is reducable
+
+    param: cfg(dict)  = mapping{node: [successors]}
+    param: entry(str) = starting node
+    param: dfs(DepthFirstSearch) = from depth_first_search, if already done
+    param: idoms(dict) = from find_immediate_dominators, if already done
+
+    returns: True/False if cfg is reducable or not
+
+    requires: depth_first_search and find_immediate_dominators functions
+    """
+    if dfs is None:
+        dfs = depth_first_search(cfg, entry)
+    if idoms is None:
+        idoms = find_immediate_dominators(cfg, entry, rpo=dfs.rpo)
+    intervals = dominator_intervals(idoms, entry)
 
-    # post order traveresal first
-    depth_first_search_helper(entry)
-    rpo_list = po_list[::-1]
     if debug:
-        print(f"The rpo list:\n{rpo_list}\n")
+        print(f"Back edges:\n{dfs.back_edges}\n\nImmediate dominators:\n{idoms}\n")
+
+    for u, v in dfs.back_edges:
+        if not dominates(v, u, intervals):
+            return False
 
-    return rpo_list
+    return True
 
 
-def find_back_edges(cfg, entry, debug=False) -> list[str]:
+def find_dominators(cfg, entry_node, debug=False) -> dict:
     """
-    desc: find back edges of a CFG using DFS
+    desc: compute the full dominator set of every node
 
-    param: cfg(dict)  = mapping{node: [successors]}
-    param: entry(str) = starting node
+    param: cfg(dict)  = mapping{node: [successors]}, or a CompactCFG
+    param: entry_node(str) = starting node
 
-    returns: list of edges(u,v) where u -> v is a back edge
+    returns: dict {node: set of dominators}
     """
+    idoms = find_immediate_dominators(cfg, entry_node, debug)
+
+    # unreachable nodes are dominated by everything
+    nodes = cfg.labels if isinstance(cfg, CompactCFG) else list(cfg.keys())
+    dominators = {n: set(nodes) for n in nodes}
+    for a_node in idoms:
+        doms = {a_node}
+        dominator = a_node
+        while dominator != entry_node:
+            dominator = idoms[dominator]
+            doms.add(dominator)
+        dominators[a_node] = doms
 
-    back_edges = []
-    visited = set()
-    visiting = set()
+    return dominators
 
-    def depth_first_search_helper(a_node):
-        visiting.add(a_node)
-        for successor in cfg.get(a_node, []):
-            if successor in visiting:
-                if debug:
-                    print(f"Found back edge:\n{successor}\n")
-                back_edges.append([a_node, successor])
-            elif successor in visited:
-                depth_first_search_helper(successor)
-            visiting.discard(a_node)
-            visited.add(a_node)
-        if debug:
-            print(f"The node:\n{a_node}\n\nThe back edges list:\n{back_edges}\n")
 
-    depth_first_search_helper(entry)
+# whole program
 
-    for n in cfg.keys():
-        if n not in visited:
-            depth_first_search_helper(n)
 
-    return back_edges
+def find_call_sites(block_map) -> list[tuple[str, str]]:
+    """
+    desc: find the calls made in a function from the `funcs` field
+          of its `call` instructions
 
+    param: block_map(dict) = mapping{node: block}
 
-def is_reduceable(cfg, entry, debug=False) -> bool:
+    returns: list of (block, callee) in program order
     """
-    desc: determine whether a cfg is reducable
-
-    param: cfg(dict)  = mapping{node: [successors]}
-    param: entry(str) = starting node
+    call_sites = []
+    for name, block in block_map.items():
+        for inst in block:
+            if inst.get("op") == "call":
+                call_sites.extend((name, callee) for callee in inst.get("funcs", []))
+    return call_sites
 
-    returns: True/False if cfg is reducable or not
 
-    requires: find_back_edges and reverse_postorder functions
+class ProgramCFG:
+    """
+    desc: whole program view of a bril program, each function's blocks,
+          cfg and statistics are only built the first time they're asked
+          for, and then kept
     """
-    back_edges = find_back_edges(cfg, entry)
-
-    dominators = find_dominators(cfg, entry)
 
-    if debug:
-        print(f"Back edges:\n{back_edges}\n\nDominators:\n{dominators}\n")
+    def __init__(self, prog, debug=False):
+        # a packed program only unpacks the functions asked about
+        self.funcs = functions_by_name(prog)
+        self.debug = debug
+        self.block_maps = {}
+        self.cfgs = {}
+        self.func_stats = {}
+        self.func_loops = {}
+        self.func_dfs = {}
+        self.func_idoms = {}
+
+    def block_map(self, name) -> dict:
+        if name not in self.block_maps:
+            instrs = self.funcs[name].get("instrs", [])
+            blocks = list(form_blocks(instrs, self.debug))
+            self.block_maps[name] = map_blocks(blocks, self.debug)
+        return self.block_maps[name]
+
+    def cfg(self, name) -> dict:
+        if name not in self.cfgs:
+            self.cfgs[name] = get_cfg(self.block_map(name), self.debug)
+        return self.cfgs[name]
+
+    def dfs(self, name) -> DepthFirstSearch:
+        """
+        desc: depth first search of a function's cfg from its entry,
+              shared by everything that needs rpo or back edges
+        """
+        if name not in self.func_dfs:
+            cfg = self.cfg(name)
+            self.func_dfs[name] = depth_first_search(cfg, next(iter(cfg)))
+        return self.func_dfs[name]
+
+    def idoms(self, name) -> dict:
+        """
+        desc: immediate dominators of a function's reachable blocks
+        """
+        if name not in self.func_idoms:
+            cfg = self.cfg(name)
+            self.func_idoms[name] = find_immediate_dominators(
+                cfg, next(iter(cfg)), rpo=self.dfs(name).rpo
+            )
+        return self.func_idoms[name]
+
+    def stats(self, name) -> dict:
+        """
+        desc: reducibility, dominator and back edge statistics
+
+        returns: dict {blocks, edges, unreachable, back_edges,
+                       dominator_depth, reduceable}
+        """
+        if name in self.func_stats:
+            return self.func_stats[name]
+
+        cfg = self.cfg(name)
+        stats = {
+            "blocks": len(cfg),
+            "edges": sum(len(successors) for successors in cfg.values()),
+            "unreachable": 0,
+            "back_edges": 0,
+            "dominator_depth": 0,
+            "reduceable": True,
+        }
+        if cfg:
+            entry = next(iter(cfg))
+            dfs = self.dfs(name)
+            idoms = self.idoms(name)
+            intervals = dominator_intervals(idoms, entry)
+
+            # a node's idom always comes before it in rpo
+            depth = {entry: 0}
+            for a_node in dfs.rpo[1:]:
+                depth[a_node] = depth[idoms[a_node]] + 1
+
+            stats["unreachable"] = len(cfg) - len(dfs.rpo)
+            stats["back_edges"] = len(dfs.back_edges)
+            stats["dominator_depth"] = max(depth.values())
+            stats["reduceable"] = all(
+                dominates(v, u, intervals) for u, v in dfs.back_edges
+            )
 
-    for u, v in back_edges:
-        if v not in dominators[u]:
-            return False
+        self.func_stats[name] = stats
+        return stats
+
+    def loops(self, name):
+        """
+        desc: natural loops of a function, see loops.find_loops
+
+        returns: LoopForest, empty for a function without blocks
+        """
+        if name not in self.func_loops:
+            cfg = self.cfg(name)
+            if cfg:
+                forest = find_loops(
+                    cfg,
+                    next(iter(cfg)),
+                    self.debug,
+                    dfs=self.dfs(name),
+                    idoms=self.idoms(name),
+                )
+            else:
+                forest = LoopForest({}, [], {})
+            self.func_loops[name] = forest
+        return self.func_loops[name]
 
-    return True
+    def call_sites(self, name) -> list[tuple[str, str]]:
+        return find_call_sites(self.block_map(name))
 
+    def call_graph(self) -> dict:
+        """
+        desc: interprocedural call graph
 
-def find_dominators(cfg, entry_node, debug=False) -> dict:
-    rpo = reverse_postorder(cfg, entry_node)
+        returns: dict {function: [callees]}, each callee listed once
+        """
+        return {
+            name: list(dict.fromkeys(callee for _, callee in self.call_sites(name)))
+            for name in self.funcs
+        }
 
-    predecessors = {n: [] for n in cfg}
 
-    for n, successors in cfg.items():
-        for sucessor in successors:
-            predecessors[sucessor].append(n)
+def function_part(program, name, reduce, labels) -> dict:
+    """
+    desc: the pieces of the whole program output that only depend on one
+          function, kept apart so they can be cached per function
 
-    dominators = {n: set(cfg.keys()) for n in cfg}
-    dominators[entry_node] = {entry_node}
+    param: program(ProgramCFG) = the program
+    param: name(str)           = function name
 
-    while True:
-        changed = False
+    returns: dict {cluster: DOT subgraph, entry: entry block or None,
+                   calls: [[block, callee]], stats: statistics line (with
+                   reduce)}
+    """
+    cfg = program.cfg(name)
+    cluster = io.StringIO()
+    block_map = program.block_map(name) if labels else None
+    write_dot(cfg, cluster, block_map, cluster=name, debug=program.debug)
+    part = {
+        "cluster": cluster.getvalue(),
+        "entry": next(iter(cfg), None),
+        "calls": [list(call) for call in program.call_sites(name)],
+    }
+    if reduce:
+        stats = program.stats(name)
+        part["stats"] = (
+            f"@{name}: {stats['blocks']} blocks, {stats['edges']} edges, "
+            f"{stats['unreachable']} unreachable, "
+            f"{stats['back_edges']} back edges, "
+            f"dominator tree depth {stats['dominator_depth']}, "
+            f"is reducable: {stats['reduceable']}"
+        )
+    return part
+
+
+def whole_program(prog, debug_mode, reduce, labels, cache=None) -> None:
+    """
+    desc: print the statistics (with reduce) and the DOT script of every
+          function of a program, plus the call graph
 
-        for a_node in rpo:
-            if a_node == entry_node:
+    param: cache(ResultCache) = where to keep each function's part of the
+                                output, keyed by its name and instructions
+    """
+    program = ProgramCFG(prog, debug_mode)
+
+    parts = {}
+    for name in program.funcs:
+        key = None
+        if cache is not None:
+            func = program.funcs[name]
+            drawn = {"name": name, "instrs": func.get("instrs", [])}
+            key = cache.key("mycfg-function", [reduce, labels], drawn)
+            text = cache.get(key)
+            if text is not None:
+                parts[name] = json.loads(text)
                 continue
-            new_doms = set(cfg.keys())
+        parts[name] = function_part(program, name, reduce, labels)
+        if key is not None:
+            cache.put(key, json.dumps(parts[name]))
 
-            for predecessor in predecessors.get(a_node, []):
-                new_doms = new_doms.intersection(dominators[predecessor])
-
-            new_doms.add(a_node)
+    out = sys.stdout
+    if reduce:
+        for part in parts.values():
+            out.write(part["stats"] + "\n")
+        call_graph = {
+            name: list(dict.fromkeys(callee for _, callee in part["calls"]))
+            for name, part in parts.items()
+        }
+        out.write(f"Call graph: {call_graph}\n\n")
+
+    out.write("digraph {\n")
+    for part in parts.values():
+        out.write(part["cluster"])
+    entries = {name: part["entry"] for name, part in parts.items()}
+    calls = [
+        (name, block, callee)
+        for name, part in parts.items()
+        for block, callee in part["calls"]
+    ]
+    write_call_edges(out, calls, entries)
+    out.write("}\n\n")
+
+
+def mycfg(
+    debug_mode: bool,
+    reduce: bool,
+    labels: bool = False,
+    all_funcs: bool = False,
+    file_path: str = None,
+    cache: ResultCache = None,
+) -> None:
+    # load JSON or a packed program from the file, or stdin
+    prog = load_bril(file_path)
+    if cache is None or debug_mode:
+        print_cfgs(prog, debug_mode, reduce, labels, all_funcs)
+        return
 
-            if new_doms != dominators[a_node]:
-                dominators[a_node] = new_doms
-                changed = True
+    # every function of the program is cached on its own
+    funcs = prog.get("functions", [])
+    if all_funcs:
+        if funcs:
+            whole_program(prog, debug_mode, reduce, labels, cache)
+        return
 
-        if not changed:
-            break
+    # the output only depends on the options and the function drawn
+    drawn = funcs[0].get("instrs", []) if funcs else []
+    key = cache.key("mycfg", [reduce, labels], drawn)
+    text = cache.get(key)
+    if text is None:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            print_cfgs(prog, debug_mode, reduce, labels, all_funcs)
+        text = out.getvalue()
+        cache.put(key, text)
+    sys.stdout.write(text)
 
-    return dominators
 
+def print_cfgs(prog, debug_mode, reduce, labels, all_funcs) -> None:
+    """
+    desc: print the DOT script for the first function of a program, or
+          for every function with all_funcs, with reducibility if asked
 
-def mycfg(debug_mode: bool, reduce: bool) -> None:
-    # load JSON from stdin
-    prog = json.load(sys.stdin)
+    param: prog(dict) = bril program
+    """
     funcs = prog.get("functions", [])
     if not funcs:
         return
+    if all_funcs:
+        whole_program(prog, debug_mode, reduce, labels)
+        return
     # loading the just the first function, for now
     func_instrs = funcs[0].get("instrs", [])
     if not func_instrs:
@@ -348,11 +642,18 @@ def mycfg(debug_mode: bool, reduce: bool) -> None:
     if reduce:
         print(f"Is reducable: {reduceable}\n")
 
-    dot_string = gen_dot(new_cfg, debug_mode)
-    print(dot_string)
+    block_map = name_to_block if labels else None
+    if not debug_mode:
+        write_dot(new_cfg, sys.stdout, block_map)
+        print()
+        return
 
-    if debug_mode:
-        print(f"\nThe digraph:\n{dot_string}")
+    # the trace comes out while the script is written, so keep the
+    # script to print it again after the trace
+    dot_script = io.StringIO()
+    write_dot(new_cfg, dot_script, block_map, debug=debug_mode)
+    print(dot_script.getvalue())
+    print(f"\nThe digraph:\n{dot_script.getvalue()}")
 
 
 if __name__ == "__main__":
@@ -369,5 +670,37 @@ if __name__ == "__main__":
         action="store_true",
         help="Check if a bril program is reduceable.",
     )
+    parser.add_argument(
+        "file",
+        nargs="?",
+        help="Input file to proccess. If not provided, reads from stdin",
+    )
+    parser.add_argument(
+        "-l",
+        "--labels",
+        action="store_true",
+        help="Label each node with the instructions in its block.",
+    )
+    parser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        help="Build a CFG for every function, plus the call graph.",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Reuse the output for unchanged programs from this directory.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="Evict the least recently used outputs past this size.",
+    )
     args = parser.parse_args()
-    mycfg(args.debug, args.reduceable)
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+    mycfg(args.debug, args.reduceable, args.labels, args.all, args.file, cache)
@@ -0,0 +1,93 @@
+"""Check that `mycfg.py --cache` prints the same thing warm as it does
+cold and without a cache, for every test program and set of flags.
+
+Run with `python3 -m unittest` (or pytest) from this directory.
+"""
+
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import briltxt
+import mycfg
+from resultcache import ResultCache
+
+# (reduce, labels, all_funcs)
+FLAGS = [
+    (False, False, False),
+    (True, False, False),
+    (False, True, False),
+    (False, False, True),
+    (True, False, True),
+    (False, True, True),
+]
+
+
+def run(path, flags, cache=None):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        mycfg.mycfg(False, *flags, file_path=path, cache=cache)
+    return out.getvalue()
+
+
+class CacheTest(unittest.TestCase):
+    def test_cold_warm(self):
+        programs = glob.glob(os.path.join(HERE, "*.bril"))
+        programs += glob.glob(os.path.join(HERE, "cfg", "*.bril"))
+        with tempfile.TemporaryDirectory() as tmp:
+            for bril in sorted(programs):
+                path = os.path.join(tmp, "prog.json")
+                with open(bril) as f, open(path, "w") as out:
+                    text = briltxt.parse_bril(f.read())
+                    out.write(text)
+                # -a caches each function on its own
+                n = len(json.loads(text)["functions"])
+                for flags in FLAGS:
+                    with self.subTest(program=os.path.basename(bril), flags=flags):
+                        expected = run(path, flags)
+                        cache_dir = os.path.join(tmp, "cache")
+                        self.assertEqual(
+                            run(path, flags, ResultCache(cache_dir)), expected
+                        )
+                        warm = ResultCache(cache_dir)
+                        self.assertEqual(run(path, flags, warm), expected)
+                        hits = n if flags[2] else 1
+                        self.assertEqual((warm.hits, warm.misses), (hits, 0))
+
+    def test_edit_one_function(self):
+        with open(os.path.join(HERE, "cfg", "calls.bril")) as f:
+            prog = json.loads(briltxt.parse_bril(f.read()))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prog.json")
+            cache_dir = os.path.join(tmp, "cache")
+            for flags in FLAGS:
+                if not flags[2]:
+                    continue
+                with self.subTest(flags=flags):
+                    with open(path, "w") as out:
+                        json.dump(prog, out)
+                    run(path, flags, ResultCache(cache_dir))
+
+                    # retarget the first branch of the second function
+                    edited = json.loads(json.dumps(prog))
+                    instrs = edited["functions"][1]["instrs"]
+                    branch = next(i for i in instrs if i.get("op") == "br")
+                    branch["labels"].reverse()
+                    with open(path, "w") as out:
+                        json.dump(edited, out)
+                    cache = ResultCache(cache_dir)
+                    self.assertEqual(run(path, flags, cache), run(path, flags))
+                    n = len(edited["functions"])
+                    self.assertEqual((cache.hits, cache.misses), (n - 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
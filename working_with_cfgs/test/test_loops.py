@@ -0,0 +1,145 @@
+"""Tests of `loops.find_loops` and `loops.loop_depth` on small CFGs.
+
+Run with `python3 -m unittest` (or pytest) from this directory.
+"""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from loops import LoopForest, find_loops, loop_depth
+from mycfg import depth_first_search, find_immediate_dominators
+
+
+class FindLoopsTest(unittest.TestCase):
+    def test_nested(self):
+        # h1 holds two sibling loops, h2 and h3, and h2 holds h4.
+        cfg = {
+            "entry": ["h1"],
+            "h1": ["h2", "exit"],
+            "h2": ["h4", "m"],
+            "h4": ["h4b", "h2l"],
+            "h4b": ["h4"],
+            "h2l": ["h2"],
+            "m": ["h3"],
+            "h3": ["h3b", "l1"],
+            "h3b": ["h3"],
+            "l1": ["h1"],
+            "exit": [],
+        }
+        forest = find_loops(cfg, "entry")
+        self.assertEqual(forest.roots, ["h1"])
+        self.assertEqual(list(forest.loops), ["h1", "h2", "h4", "h3"])
+        h1, h2, h3, h4 = (forest.loops[h] for h in ("h1", "h2", "h3", "h4"))
+        self.assertEqual(h1.blocks, frozenset(cfg) - {"entry", "exit"})
+        self.assertEqual(h2.blocks, {"h2", "h4", "h4b", "h2l"})
+        self.assertEqual(h3.blocks, {"h3", "h3b"})
+        self.assertEqual(h4.blocks, {"h4", "h4b"})
+        self.assertEqual(
+            (h1.parent, h2.parent, h3.parent, h4.parent), (None, "h1", "h1", "h2")
+        )
+        self.assertEqual(h1.children, ["h2", "h3"])
+        self.assertEqual(h2.children, ["h4"])
+        self.assertEqual((h1.depth, h2.depth, h3.depth, h4.depth), (1, 2, 2, 3))
+        self.assertEqual(h2.exits, [["h2", "m"]])
+        self.assertEqual(forest.innermost["h4b"], "h4")
+        self.assertEqual(forest.innermost["h2l"], "h2")
+        self.assertEqual(forest.innermost["m"], "h1")
+        depths = {n: loop_depth(forest, n) for n in cfg}
+        self.assertEqual(
+            depths,
+            {
+                "entry": 0,
+                "h1": 1,
+                "h2": 2,
+                "h4": 3,
+                "h4b": 3,
+                "h2l": 2,
+                "m": 1,
+                "h3": 2,
+                "h3b": 2,
+                "l1": 1,
+                "exit": 0,
+            },
+        )
+
+    def test_several_latches(self):
+        cfg = {
+            "entry": ["h"],
+            "h": ["a", "x"],
+            "a": ["l1", "l2"],
+            "l1": ["h"],
+            "l2": ["h"],
+            "x": [],
+        }
+        forest = find_loops(cfg, "entry")
+        self.assertEqual(list(forest.loops), ["h"])
+        loop = forest.loops["h"]
+        self.assertEqual(sorted(loop.latches), ["l1", "l2"])
+        self.assertEqual(loop.blocks, {"h", "a", "l1", "l2"})
+        self.assertEqual(loop.exits, [["h", "x"]])
+
+    def test_several_exits(self):
+        cfg = {
+            "entry": ["h"],
+            "h": ["a", "x1"],
+            "a": ["b", "x2"],
+            "b": ["h", "x3"],
+            "x1": [],
+            "x2": [],
+            "x3": ["x1"],
+        }
+        loop = find_loops(cfg, "entry").loops["h"]
+        self.assertEqual(loop.blocks, {"h", "a", "b"})
+        self.assertEqual(loop.exits, [["h", "x1"], ["a", "x2"], ["b", "x3"]])
+
+    def test_self_loop(self):
+        cfg = {"entry": ["h"], "h": ["h", "x"], "x": []}
+        loop = find_loops(cfg, "entry").loops["h"]
+        self.assertEqual((loop.blocks, loop.latches), ({"h"}, ["h"]))
+
+    def test_irreducible(self):
+        # The a <-> b cycle can be entered at either block, so neither
+        # dominates the other and it isn't a natural loop.
+        cfg = {"entry": ["a", "b"], "a": ["b"], "b": ["a", "x"], "x": []}
+        self.assertEqual(find_loops(cfg, "entry"), LoopForest({}, [], {}))
+
+    def test_irreducible_inside_loop(self):
+        # The same cycle inside a natural loop is part of its body, with
+        # no loop of its own.
+        cfg = {
+            "entry": ["h"],
+            "h": ["a", "b", "x"],
+            "a": ["b"],
+            "b": ["a", "h"],
+            "x": [],
+        }
+        forest = find_loops(cfg, "entry")
+        self.assertEqual(list(forest.loops), ["h"])
+        self.assertEqual(forest.loops["h"].blocks, {"h", "a", "b"})
+        self.assertEqual(forest.loops["h"].latches, ["b"])
+        self.assertEqual(loop_depth(forest, "a"), 1)
+
+    def test_unreachable_cycle(self):
+        cfg = {"entry": ["x"], "x": [], "u": ["v"], "v": ["u"]}
+        self.assertEqual(find_loops(cfg, "entry").loops, {})
+
+    def test_shared_analyses(self):
+        cfg = {
+            "entry": ["h"],
+            "h": ["a", "x"],
+            "a": ["h"],
+            "x": [],
+        }
+        dfs = depth_first_search(cfg, "entry")
+        idoms = find_immediate_dominators(cfg, "entry", rpo=dfs.rpo)
+        self.assertEqual(
+            find_loops(cfg, "entry", dfs=dfs, idoms=idoms), find_loops(cfg, "entry")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()